@@ -8,17 +8,25 @@ if __name__ == "__main__":
   arg_parser = argparse.ArgumentParser()
   arg_parser.add_argument("audio_file", nargs="?")
   arg_parser.add_argument("--onsets_hop_length", type=int, default=1)
+  arg_parser.add_argument("--onsets_coarse_hop_length", type=int, default=512)
+  arg_parser.add_argument("--pair_tolerance", type=float, default=None)
   arg_parser.add_argument("--start", type=time_type("--start"), default=0.0)
   arg_parser.add_argument("--length", type=time_type("--length"), default=None)
+  arg_parser.add_argument("--cache_dir", default=None)
+  arg_parser.add_argument("--cache_max_size", type=float, default=1024)
   
   args = arg_parser.parse_args()
 
   options = SimpleNamespace(
     onsets_hop_length = args.onsets_hop_length,
+    onsets_coarse_hop_length = args.onsets_coarse_hop_length,
+    pair_tolerance = args.pair_tolerance,
     analysis_channels = (0, 1),
     analysis_channel_colors = ("#1a85ff", "#d41159"),
     start = args.start,
     length = args.length,
+    cache_dir = args.cache_dir,
+    cache_max_size = args.cache_max_size,
     win_len = args.window_length,
     plot_win = args.plot_window
   )
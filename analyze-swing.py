@@ -3,7 +3,7 @@ if __name__ == "__main__":
   import re
   from types import SimpleNamespace
 
-  from latency_analyzer import app_swing, analysis
+  from latency_analyzer import analysis
 
   def duration_type(arg_name):
     def _duration_type(arg):
@@ -56,8 +56,11 @@ if __name__ == "__main__":
   arg_parser.add_argument("--render_env_method", type=env_method_type("--render_env_method"), default=analysis.SwingAnalysis.default_render_env_method)
   arg_parser.add_argument("--render_env_invert",  action=argparse.BooleanOptionalAction)
   arg_parser.add_argument("--win_len", type=duration_type("--win_len"), default=None)
+  arg_parser.add_argument("--win_hop", type=duration_type("--win_hop"), default=None)
   arg_parser.add_argument("--win_type", type=win_type, default=analysis.SwingAnalysis.default_win_type)
   arg_parser.add_argument("--swing_freq", type=float, default=None)
+  arg_parser.add_argument("--swing_freq_decimate", type=int, default=None)
+  arg_parser.add_argument("--swing_freq_drift_tolerance", type=float, default=None)
   arg_parser.add_argument("--rms_win_len", type=duration_type("--rms_win_len"), default=2000)
   arg_parser.add_argument("--bin_re", default=None)
   arg_parser.add_argument("--bin_name", default="bin")
@@ -66,23 +69,96 @@ if __name__ == "__main__":
   arg_parser.add_argument("--font_size", type=float, default=12)
   arg_parser.add_argument("--env_trim", type=duration_type("--env_trim"), default=SimpleNamespace(seconds=0.1))
   arg_parser.add_argument("--allow_negative_lag", action=argparse.BooleanOptionalAction)
+  arg_parser.add_argument("--batch", action=argparse.BooleanOptionalAction)
+  arg_parser.add_argument("--precompute_envs", action=argparse.BooleanOptionalAction)
+  arg_parser.add_argument("--decimate", type=int, default=1)
+  arg_parser.add_argument("--dtype", choices=analysis.SwingAnalysis.dtypes, default=analysis.SwingAnalysis.default_dtype)
+  arg_parser.add_argument("--cache_dir", default=None)
+  arg_parser.add_argument("--cache_max_size", type=float, default=1024)
+  arg_parser.add_argument("--cache_hash", action=argparse.BooleanOptionalAction)
+  arg_parser.add_argument("--jobs", type=int, default=1)
+  arg_parser.add_argument("--fft_workers", type=int, default=-1)
+  arg_parser.add_argument("--keep_signals", action=argparse.BooleanOptionalAction)
+  arg_parser.add_argument("--signals_cache_size", type=int, default=8)
+  arg_parser.add_argument("--corr_mode", choices=analysis.SwingAnalysis.corr_modes, default=analysis.SwingAnalysis.default_corr_mode)
   arg_parser.add_argument("--box_plot_means", action=argparse.BooleanOptionalAction)
   arg_parser.add_argument("--ymin", type=float, default=None)
   arg_parser.add_argument("--ymax", type=float, default=None)
   arg_parser.add_argument("--save_bins_boxplot", default=None)
   arg_parser.add_argument("--save_windows_boxplot", default=None)
   arg_parser.add_argument("--save_lags_csv", default=None)
+  arg_parser.add_argument("--save_bin_stats", default=None)
+  arg_parser.add_argument("--merge_bin_stats", nargs="*", default=None)
+  arg_parser.add_argument("--save_results", default=None)
+  arg_parser.add_argument("--save_results_append", action=argparse.BooleanOptionalAction)
   arg_parser.add_argument("--plot_width", type=float, default=16)
   arg_parser.add_argument("--plot_height", type=float, default=7)
   arg_parser.add_argument("--headless", action=argparse.BooleanOptionalAction)
   arg_parser.add_argument("--ytick_base", type=float, default=None)
+  arg_parser.add_argument("--verbose", action=argparse.BooleanOptionalAction)
+  arg_parser.add_argument("--save_profile", default=None)
+  arg_parser.add_argument("--profile_memory", action=argparse.BooleanOptionalAction)
+  arg_parser.add_argument("--stream", action=argparse.BooleanOptionalAction)
+  arg_parser.add_argument("--stream_block_len", type=int, default=4096)
   
   args = arg_parser.parse_args()
 
   args.analysis_channel_colors = ("#1a85ff", "#d41159")
+
+  if args.stream:
+    # print lags as windows complete instead of opening the GUI
+    import soundfile
+
+    if args.audio_file is None or args.win_len is None:
+      arg_parser.error("--stream needs an audio file and --win_len")
+    if args.mic_channel[0] != args.render_channel[0]:
+      arg_parser.error("--stream needs the mic and render channels in the same file")
+
+    with soundfile.SoundFile(args.audio_file) as audio_file:
+      stream = analysis.SwingStream(
+        audio_file.samplerate,
+        args.rms_win_len,
+        args.win_len,
+        win_hop=args.win_hop,
+        mic_channel=args.mic_channel[1],
+        render_channel=args.render_channel[1],
+        mic_env_method=args.mic_env_method,
+        render_env_method=args.render_env_method,
+        mic_env_invert=args.mic_env_invert,
+        render_env_invert=args.render_env_invert,
+        env_trim=args.env_trim,
+        swing_freq=args.swing_freq,
+        swing_freq_decimate=args.swing_freq_decimate,
+        swing_freq_drift_tolerance=args.swing_freq_drift_tolerance,
+        allow_negative_lag=args.allow_negative_lag,
+        corr_mode=args.corr_mode,
+        decimate=args.decimate,
+        dtype=args.dtype,
+        fft_planner=analysis.FFTPlanner(workers=args.fft_workers)
+      )
+      blocks = audio_file.blocks(args.stream_block_len, dtype=args.dtype, always_2d=True)
+      for result in stream.process(blocks):
+        print(f"{result.start / audio_file.samplerate:.03f} s: lag = {result.lag * 1000:.03f} ms, max corr = {result.max_corr:.03f}")
+    raise SystemExit
+
+  if args.headless:
+    # no GUI modules at all, so this also runs without a display. with an explicit backend,
+    # matplotlib doesn't go through pyplot to pick one when figures are saved
+    import os
+    os.environ.setdefault("MPLBACKEND", "agg")
+
+    from latency_analyzer import batch
+
+    batch.analyze_path(
+      args.audio_file, args,
+      batch.make_re_bin_func(args.bin_name, args.bin_re) if args.bin_re is not None else None
+    )
+    raise SystemExit
     
   import tkinter as tk
 
+  from latency_analyzer import app_swing
+
   root = tk.Tk()
   app = app_swing.App(root, args)
   app.run()
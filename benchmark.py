@@ -0,0 +1,159 @@
+import contextlib
+import io
+import json
+import platform
+import time
+import tracemalloc
+
+import numpy as np
+
+# each case analyzes one synthetic recording; throughput is input samples per second of analysis,
+# peak memory is what tracemalloc sees allocated during the analysis (numpy arrays included),
+# and lag error is how far the measured latencies are from the injected one
+
+swing_cases = [
+  {"name": f"swing win {win_s}s{suffix}", "win_len_s": win_s, "kwargs": kwargs}
+  for win_s in (2, 5, 10, 30)
+  for suffix, kwargs in (
+    ("", {}),
+    (" batch", {"batch": True}),
+    (" decimate 48", {"decimate": 48}),
+    (" rms/rms bounded", {"render_env_method": "rms", "corr_mode": "bounded"}),
+  )
+]
+
+bonk_cases = [
+  {"name": f"bonk hop {hop}", "hop_length": hop}
+  for hop in (64, 256, 512)
+] + [
+  {"name": f"bonk hop 1 coarse {coarse}", "hop_length": 1, "coarse_hop_length": coarse}
+  for coarse in (256, 512)
+]
+
+def measure(func):
+  # (result, seconds, peak bytes), with the analyses' progress output swallowed
+  tracemalloc.start()
+  start = time.perf_counter()
+  with contextlib.redirect_stdout(io.StringIO()):
+    result = func()
+  seconds = time.perf_counter() - start
+  _, peak = tracemalloc.get_traced_memory()
+  tracemalloc.stop()
+  return result, seconds, peak
+
+def run_swing_case(case, recording):
+  from types import SimpleNamespace
+
+  from latency_analyzer.analysis import SwingAnalysis
+
+  analysis, seconds, peak = measure(lambda: SwingAnalysis(
+    recording.mic.copy(), recording.render.copy(), recording.sample_rate, 2000,
+    win_len=SimpleNamespace(seconds=case["win_len_s"]),
+    env_trim=SimpleNamespace(seconds=0.1),
+    overwrite_input=True,
+    **case["kwargs"]
+  ))
+  errors = np.abs(analysis.results["lag"] - recording.latency) * 1000
+  return {
+    "samples_per_s": len(recording.mic) / seconds,
+    "peak_mb": peak / 2**20,
+    "lag_error_median_ms": float(np.median(errors)) if len(errors) else float("nan"),
+    "lag_error_max_ms": float(np.max(errors)) if len(errors) else float("nan"),
+  }
+
+def run_bonk_case(case, recording):
+  from latency_analyzer.analysis import BonkAnalysis
+
+  analysis, seconds, peak = measure(lambda: BonkAnalysis(
+    recording.audio, recording.sample_rate,
+    onset_detect_kwargs={"units": "time", "hop_length": case["hop_length"], "backtrack": True},
+    coarse_hop_length=case.get("coarse_hop_length")
+  ))
+  errors = np.abs(analysis.pairs[0].latencies - recording.latency) * 1000
+  return {
+    "samples_per_s": recording.audio.shape[1] / seconds,
+    "peak_mb": peak / 2**20,
+    "lag_error_median_ms": float(np.median(errors)) if len(errors) else float("nan"),
+    "lag_error_max_ms": float(np.max(errors)) if len(errors) else float("nan"),
+  }
+
+def compare(results, baseline, tolerance):
+  # regressions against the baseline: slower, bigger or less accurate by more than tolerance
+  regressions = []
+  for name, result in results.items():
+    base = baseline.get(name)
+    if base is None:
+      continue
+    if result["samples_per_s"] < base["samples_per_s"] * (1 - tolerance):
+      regressions.append(f"{name}: {result['samples_per_s']:.3g} samples/s, baseline {base['samples_per_s']:.3g}")
+    if result["peak_mb"] > base["peak_mb"] * (1 + tolerance) + 1:
+      regressions.append(f"{name}: peak {result['peak_mb']:.1f} MB, baseline {base['peak_mb']:.1f} MB")
+    if result["lag_error_median_ms"] > base["lag_error_median_ms"] * (1 + tolerance) + 0.05:
+      regressions.append(f"{name}: median lag error {result['lag_error_median_ms']:.3f} ms, baseline {base['lag_error_median_ms']:.3f} ms")
+  return regressions
+
+if __name__ == "__main__":
+  import argparse
+  import os
+  import re
+  import sys
+
+  from latency_analyzer import synthetic
+
+  arg_parser = argparse.ArgumentParser()
+  arg_parser.add_argument("--baseline", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmarks", "baseline.json"))
+  arg_parser.add_argument("--save_baseline", action=argparse.BooleanOptionalAction)
+  arg_parser.add_argument("--tolerance", type=float, default=0.25)
+  arg_parser.add_argument("--filter", default=None)
+  arg_parser.add_argument("--duration", type=float, default=60.0)
+  arg_parser.add_argument("--latency", type=float, default=0.0123)
+  arg_parser.add_argument("--swing_freq", type=float, default=0.9)
+  arg_parser.add_argument("--noise", type=float, default=0.01)
+  arg_parser.add_argument("--reverb_time", type=float, default=0.3)
+
+  args = arg_parser.parse_args()
+
+  filter_re = re.compile(args.filter) if args.filter is not None else None
+  def selected(case):
+    return filter_re is None or filter_re.search(case["name"])
+
+  results = {}
+  swing = synthetic.swing_pair(duration=args.duration, latency=args.latency, swing_freq=args.swing_freq, noise=args.noise, reverb_time=args.reverb_time)
+  for case in filter(selected, swing_cases):
+    results[case["name"]] = run_swing_case(case, swing)
+    print(case["name"], results[case["name"]], file=sys.stderr)
+
+  # the first onset detection imports librosa and compiles its numba kernels; don't charge that to
+  # the first case
+  import librosa
+
+  warm_up = synthetic.click_train_pair(duration=1.0, latency=args.latency)
+  librosa.onset.onset_detect(y=warm_up.audio[0], sr=warm_up.sample_rate, units="time", backtrack=True)
+
+  bonk = synthetic.click_train_pair(duration=min(args.duration, 10.0), latency=args.latency, noise=args.noise / 2, reverb_time=args.reverb_time / 3)
+  for case in filter(selected, bonk_cases):
+    results[case["name"]] = run_bonk_case(case, bonk)
+    print(case["name"], results[case["name"]], file=sys.stderr)
+
+  print(f"{'case':<32} {'Msamples/s':>10} {'peak MB':>8} {'median err ms':>14} {'max err ms':>11}")
+  for name, result in results.items():
+    print(f"{name:<32} {result['samples_per_s']/1e6:>10.2f} {result['peak_mb']:>8.1f} {result['lag_error_median_ms']:>14.3f} {result['lag_error_max_ms']:>11.3f}")
+
+  machine = {"platform": platform.platform(), "processor": platform.processor(), "python": platform.python_version(), "cpus": os.cpu_count()}
+  if args.save_baseline:
+    os.makedirs(os.path.dirname(args.baseline), exist_ok=True)
+    with open(args.baseline, "w") as f:
+      signal_args = {name: getattr(args, name) for name in ("duration", "latency", "swing_freq", "noise", "reverb_time")}
+      json.dump({"machine": machine, "args": signal_args, "results": results}, f, indent=2, sort_keys=True)
+    print(f"saved baseline to {args.baseline}")
+  elif os.path.exists(args.baseline):
+    with open(args.baseline) as f:
+      baseline = json.load(f)
+    if baseline["machine"] != machine:
+      print(f"note: baseline is from another machine ({baseline['machine']['platform']}), timings may not compare")
+    regressions = compare(results, baseline["results"], args.tolerance)
+    for regression in regressions:
+      print(f"REGRESSION {regression}")
+    if regressions:
+      sys.exit(1)
+    print("no regressions")
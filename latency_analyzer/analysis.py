@@ -3,14 +3,25 @@ import os
 import time
 from types import SimpleNamespace
 
-import librosa
 import numpy as np
 import scipy
-import sortednp
 
-def peak_normalize(x):
-  x = x - np.mean(x)
-  x = x / np.max(np.abs(x))
+from .profiling import null_profiler
+
+# signal helpers operate along the last axis, so they also work on 2-D arrays of windows
+
+def abs_max(x, axis=-1, keepdims=False):
+  # np.max(np.abs(x)) without the temporary copy
+  return np.maximum(np.max(x, axis=axis, keepdims=keepdims), -np.min(x, axis=axis, keepdims=keepdims))
+
+def peak_normalize(x, inplace=False):
+  # with inplace, x is overwritten; otherwise only one copy is made
+  mean = np.mean(x, axis=-1, keepdims=True)
+  if inplace:
+    x -= mean
+  else:
+    x = x - mean
+  x /= abs_max(x, keepdims=True)
   return x
 
 def truncate_to_even(x, axis=-1):
@@ -20,12 +31,77 @@ def truncate_to_even(x, axis=-1):
   else:
     return x
 
+class FFTPlanner:
+  # FFTs padded to fast lengths and run on `workers` threads (as in scipy.fft; -1 is all cores).
+  # correlations use whichever of direct or FFT evaluation measured faster for their sizes.
+  # the choices are cached, since windows and blocks repeat the same few sizes
+  
+  # problems whose direct evaluation would take more multiply-adds than this aren't timed
+  # (that alone could take seconds); scipy's estimate is used for them instead
+  measure_max_cost = 2**26
+
+  def __init__(self, workers=1):
+    self.workers = workers
+    self.corr_methods = {}
+
+  @property
+  def num_workers(self):
+    # workers as a count; negative values count back from all cores, as in scipy.fft
+    return self.workers if self.workers > 0 else max(1, (os.cpu_count() or 1) + 1 + self.workers)
+
+  def fast_len(self, n, real=True):
+    return scipy.fft.next_fast_len(n, real=real)
+
+  def rfft(self, x, n=None, axis=-1):
+    return scipy.fft.rfft(x, n, axis=axis, workers=self.workers)
+
+  def irfft(self, x, n=None, axis=-1):
+    return scipy.fft.irfft(x, n, axis=axis, workers=self.workers)
+
+  def hilbert(self, x):
+    # the imaginary part of scipy.signal.hilbert(x, N=fast_len(n))[..., :n] along the last axis (the
+    # real part is x). only real FFTs: that's -i*sign(f) on the positive frequencies, DC and Nyquist
+    # dropped, where the analytic signal would need a complex inverse FFT twice the size.
+    # unless n is a fast length, the zero padding makes this differ from the unpadded (circular)
+    # transform: a lot within a few thousand samples of the ends, which env_trim is for, and by
+    # a few 1e-4 of the envelope's peak elsewhere
+    n = x.shape[-1]
+    n_fft = self.fast_len(n)
+    spectrum = self.rfft(x, n_fft)
+    spectrum[..., 0] = 0
+    if n_fft % 2 == 0:
+      spectrum[..., -1] = 0
+    spectrum *= -1j
+    return self.irfft(spectrum, n_fft)[..., :n]
+
+  def corr_method(self, x, y, mode="full"):
+    key = (x.shape, y.shape, x.dtype.str, y.dtype.str, mode)
+    method = self.corr_methods.get(key)
+    if method is None:
+      num_out = x.size + y.size - 1 if mode == "full" else abs(x.size - y.size) + 1
+      if num_out * min(x.size, y.size) <= self.measure_max_cost:
+        with scipy.fft.set_workers(self.workers):
+          method, _ = scipy.signal.choose_conv_method(x, y, mode=mode, measure=True)
+      else:
+        method = scipy.signal.choose_conv_method(x, y, mode=mode)
+      self.corr_methods[key] = method
+    return method
+
+  def correlate(self, x, y, mode="full"):
+    method = self.corr_method(x, y, mode)
+    with scipy.fft.set_workers(self.workers):
+      return scipy.signal.correlate(x, y, mode=mode, method=method)
+
+default_fft_planner = FFTPlanner()
+
 def envelope_rms(audio, win_len=2000):
-  win_len_half = win_len // 2
-  squared = np.power(audio, 2)
-  padded = np.pad(squared, (win_len_half, win_len_half-1), "constant", constant_values=(0,0))
-  window = np.ones(win_len) / win_len
-  env = np.convolve(padded, window, "valid")
+  # the mean square over win_len samples centred on each one (win_len // 2 before, the rest after),
+  # zero outside the signal. a running sum over the last axis, so O(N) whatever win_len (accumulated
+  # in double precision, output in the input's dtype)
+  import scipy.ndimage
+
+  squared = np.square(audio)
+  env = scipy.ndimage.uniform_filter1d(squared, win_len, axis=-1, mode="constant")
 
   # env[0] = 0.0
   # for i in range(1, win_len_half):
@@ -34,23 +110,58 @@ def envelope_rms(audio, win_len=2000):
   # for i in range(len(audio) - win_len_half + 1, len(audio)):
   #   env[i] = np.mean(squared[i:])
 
-  env = np.sqrt(env)
+  env = np.sqrt(env, out=env)
   # env = peak_normalize(env)
   
   assert env.shape == audio.shape, f"{env.shape} != {audio.shape}" 
   return env
 
-def envelope_hilbert(x):
-  mean = np.mean(x)
+def envelope_rms_cumsum(audio, win_len=2000, block_len=None):
+  # same windows as envelope_rms, in O(N) instead of O(N*win_len): window sums are differences
+  # of prefix sums. the prefix sums are taken in double precision and restart every block, so
+  # rounding error doesn't grow with the length of the signal
+  num_samples = audio.shape[-1]
+  win_len_half = win_len // 2
+  if block_len is None:
+    block_len = max(16 * win_len, 2**16)
+  dtype = audio.dtype if np.issubdtype(audio.dtype, np.floating) else np.float64
+  env = np.empty(audio.shape, dtype=dtype)
+
+  for start in range(0, num_samples, block_len):
+    stop = min(start + block_len, num_samples)
+    # the samples covered by windows of outputs start..stop, zero outside the signal.
+    # index 0 stays zero, so sums[..., j+win_len] - sums[..., j] is the sum of window j
+    seg_start = start - win_len_half
+    seg_stop = stop - win_len_half + win_len
+    sums = np.zeros(audio.shape[:-1] + (seg_stop - seg_start + 1,))
+    lo = max(seg_start, 0)
+    hi = min(seg_stop, num_samples)
+    np.square(audio[..., lo:hi], out=sums[..., 1+lo-seg_start:1+hi-seg_start])
+    np.cumsum(sums, axis=-1, out=sums)
+
+    window_sums = sums[..., win_len:win_len + stop - start] - sums[..., :stop - start]
+    # differences of rounded sums can come out slightly negative
+    np.maximum(window_sums, 0.0, out=window_sums)
+    env[..., start:stop] = window_sums / win_len
+
+  env = np.sqrt(env, out=env)
+
+  assert env.shape == audio.shape, f"{env.shape} != {audio.shape}"
+  return env
+
+def envelope_hilbert(x, planner=None):
+  planner = planner if planner is not None else default_fft_planner
+  mean = np.mean(x, axis=-1, keepdims=True)
   x_centered = x - mean
-  env = np.abs(scipy.signal.hilbert(x_centered))
+  # the magnitude of the analytic signal x_centered + i*hilbert(x_centered)
+  env = np.hypot(x_centered, planner.hilbert(x_centered)).astype(x.dtype, copy=False)
   # env = np.abs(scipy.fftpack.hilbert(x_centered))
-  env = env + mean
-  assert env.shape[0] == x.shape[0], f"{env.shape[0]} != {x.shape[0]}"
+  env += mean
+  assert env.shape == x.shape, f"{env.shape} != {x.shape}"
   return env
 
 def trim_edges(signal, samples):
-  return signal[samples:len(signal)-samples]
+  return signal[..., samples:signal.shape[-1]-samples]
 
 # https://dsp.stackexchange.com/a/74822
 def rolling_rms(x, n):
@@ -58,12 +169,69 @@ def rolling_rms(x, n):
   xc = np.cumsum(abs(x)**2);
   return np.sqrt((xc[n:] - xc[:-n]) / n)
 
+def decimate_mean(x, factor):
+  # the envelopes we decimate are smooth, so a block mean is enough of an anti-aliasing filter
+  if factor <= 1:
+    return x
+  length = (x.shape[-1] // factor) * factor
+  return x[..., :length].reshape(x.shape[:-1] + (-1, factor)).mean(axis=-1)
+
+def parabolic_peak(y, i):
+  # sub-bin peak position and height from the parabola through y[i-1], y[i], y[i+1]
+  if i <= 0 or i >= len(y) - 1:
+    return float(i), y[i]
+  a, b, c = y[i-1], y[i], y[i+1]
+  denom = a - 2*b + c
+  if denom == 0:
+    return float(i), b
+  p = 0.5 * (a - c) / denom
+  return i + p, b - 0.25 * (a - c) * p
+
+def estimate_swing_freq(env, sample_rate, decimate=1, min_freq=0.2, freq_resolution=0.01, planner=None):
+  planner = planner if planner is not None else default_fft_planner
+  env = decimate_mean(env, decimate)
+  sample_rate = sample_rate / decimate
+
+  # pad to at least 2N-1 so the spectrum can also be used for a linear correlation of env
+  n_fft = planner.fast_len(max(2*len(env) - 1, int(np.ceil(sample_rate / freq_resolution))))
+  spectrum = planner.rfft(env.astype(np.float64, copy=False), n_fft)
+  fax = scipy.fft.rfftfreq(n_fft, 1/sample_rate)
+
+  mag = np.abs(spectrum)
+  # ignore very low frequencies
+  mag[fax < min_freq] = 0.0
+
+  i_max = np.argmax(mag)
+  i_peak, _ = parabolic_peak(mag, i_max)
+  freq = i_peak * sample_rate / n_fft
+  
+  return SimpleNamespace(
+    freq = freq,
+    spectrum = spectrum,
+    n_fft = n_fft,
+    sample_rate = sample_rate,
+    decimate = decimate
+  )
+
+# correlation peaks of slow envelopes are very flat at audio sample rates: neighbouring lags
+# differ by less than float32 resolution. so correlations are computed in double precision,
+# whatever the dtype of the inputs
+
 # https://stackoverflow.com/q/43652911
-def xcorr_unbiased(x, y):
+def xcorr_unbiased(x, y, x_spectrum=None, n_fft=None, dtype=np.float64, planner=None):
+  planner = planner if planner is not None else default_fft_planner
   assert x.size == y.size, f"x.size={x.size} != y.size={y.size}"
-    
-  corr = scipy.signal.correlate(x, y)
-  # corr = np.correlate(x, y, "full") # takes forever
+  x = x.astype(dtype, copy=False)
+  y = y.astype(dtype, copy=False)
+
+  if x_spectrum is not None:
+    # reuse a precomputed rfft of x, padded to n_fft >= 2N-1
+    assert n_fft >= 2*x.size - 1, f"n_fft={n_fft} < 2*{x.size}-1"
+    circ = planner.irfft(x_spectrum * np.conj(planner.rfft(y, n_fft)), n_fft)
+    corr = np.concatenate((circ[n_fft-(x.size-1):], circ[:x.size]))
+  else:
+    corr = planner.correlate(x, y)
+    # corr = np.correlate(x, y, "full") # takes forever
 
   lags = np.arange(-(x.size - 1), x.size)
 
@@ -71,6 +239,160 @@ def xcorr_unbiased(x, y):
   
   return corr, lags
 
+def xcorr_unbiased_bounded(x, y, min_lag, max_lag, block_len=None, dtype=np.float64, planner=None):
+  # like xcorr_unbiased, but only for lags in [min_lag, max_lag). y is processed in blocks
+  # (overlap-save), so nothing of length 2N-1 is ever allocated
+  planner = planner if planner is not None else default_fft_planner
+  assert x.size == y.size, f"x.size={x.size} != y.size={y.size}"
+
+  n = x.size
+  min_lag = max(min_lag, -(n - 1))
+  max_lag = min(max_lag, n)
+  num_lags = max(max_lag - min_lag, 0)
+  if block_len is None:
+    block_len = max(4*num_lags, 2**14)
+
+  corr = np.zeros(num_lags, dtype=dtype)
+  for start in range(0, n if num_lags > 0 else 0, block_len):
+    y_block = y[start:start+block_len].astype(dtype, copy=False)
+    # the part of x that y_block meets at lags [min_lag, max_lag), zero-padded past the ends
+    seg_start = start + min_lag
+    seg_stop = start + len(y_block) + max_lag - 1
+    seg_lo = max(seg_start, 0)
+    seg_hi = min(seg_stop, n)
+    if seg_hi <= seg_lo:
+      continue
+    x_seg = np.pad(x[seg_lo:seg_hi].astype(dtype, copy=False), (seg_lo - seg_start, seg_stop - seg_hi))
+    corr += planner.correlate(x_seg, y_block, mode="valid")
+
+  lags = np.arange(min_lag, max_lag)
+
+  corr /= (n - np.abs(lags))
+
+  return corr, lags
+
+def overlap_scale(x, y, lag):
+  # sqrt(mean(x**2) * mean(y**2)) over only the samples that xcorr_unbiased pairs up at lag, which
+  # by Cauchy-Schwarz bounds the unbiased correlation at that lag
+  n = x.size
+  x, y = (x[lag:], y[:n-lag]) if lag >= 0 else (x[:n+lag], y[-lag:])
+  # einsum casts to double precision a chunk at a time, so long windows aren't copied
+  return np.sqrt(np.einsum("i,i->", x, x, dtype=np.float64) * np.einsum("i,i->", y, y, dtype=np.float64)) / x.size
+
+def xcorr_coarse_to_fine(x, y, min_lag, max_lag, decimate, x_spectrum=None, n_fft=None, candidates=3, planner=None):
+  # find the peak of the unbiased correlation within lags [min_lag, max_lag) by searching the
+  # decimated signals first, then refining at full rate around the coarse peak.
+  # x_spectrum is an optional precomputed rfft of the decimated x, padded to n_fft >= 2N-1.
+  # correlations are scaled to correlation coefficients. only the correlation is decimated: x and y
+  # are the full-rate envelopes, which the refinement needs anyway
+  x_dec = decimate_mean(x, decimate)
+  y_dec = decimate_mean(y, decimate)
+  
+  # coarse lags whose full-rate equivalent lies inside the band
+  coarse_min_lag = -(-min_lag // decimate)
+  coarse_max_lag = -(-max_lag // decimate)
+  if x_spectrum is not None:
+    coarse_corr, coarse_lags = xcorr_unbiased(x_dec, y_dec, x_spectrum=x_spectrum, n_fft=n_fft, planner=planner)
+    zero_i = x_dec.size - 1
+    band = slice(zero_i + max(coarse_min_lag, -zero_i), zero_i + min(coarse_max_lag, x_dec.size))
+    coarse_corr = coarse_corr[band]
+    coarse_lags = coarse_lags[band]
+  else:
+    coarse_corr, coarse_lags = xcorr_unbiased_bounded(x_dec, y_dec, coarse_min_lag, coarse_max_lag, planner=planner)
+  coarse_corr /= np.sqrt(np.mean(x_dec**2) * np.mean(y_dec**2))
+  
+  # the true peak is within one decimation step of a coarse one. decimation can reorder peaks of
+  # similar height, so refine the highest few local maxima of the coarse correlation
+  if len(coarse_corr) > 0:
+    is_local_max = np.r_[True, coarse_corr[1:] >= coarse_corr[:-1]] & np.r_[coarse_corr[:-1] >= coarse_corr[1:], True]
+    local_maxima = np.flatnonzero(is_local_max)
+    if len(local_maxima) == 0:
+      # nan compares false, so e.g. a silent window has no local maxima; refine around argmax instead
+      local_maxima = np.array([np.argmax(coarse_corr)])
+    local_maxima = local_maxima[np.argsort(coarse_corr[local_maxima])[::-1][:candidates]]
+  else:
+    local_maxima = []
+
+  # fine peaks are scaled like _pick_lag does in bounded mode
+  best = None
+  for i in local_maxima:
+    center = coarse_lags[i] * decimate
+    fine_min_lag = max(min_lag, center - decimate)
+    fine_max_lag = min(max_lag, center + decimate + 1)
+    if fine_max_lag <= fine_min_lag:
+      continue
+    fine_corr, fine_lags = xcorr_unbiased_bounded(x, y, fine_min_lag, fine_max_lag, planner=planner)
+    i_max = np.argmax(fine_corr)
+    fine_corr /= overlap_scale(x, y, fine_lags[i_max])
+    i_peak, peak = parabolic_peak(fine_corr, i_max)
+    if best is None or peak > best[1]:
+      best = (fine_lags[0] + i_peak, peak)
+
+  if best is None:
+    # nothing left to refine (the band is narrower than a decimation step): search it at full rate
+    corr, lags = xcorr_unbiased_bounded(x, y, min_lag, max_lag, planner=planner)
+    i_max, peak, _ = _pick_lag(corr, lags[0], min_lag, max_lag, x=x, y=y)
+    best = (lags[i_max], peak)
+
+  return SimpleNamespace(
+    lag = best[0],
+    peak = best[1],
+    corr = coarse_corr,
+    lags = coarse_lags * decimate
+  )
+
+# per-window scalar results, one row per window
+window_result_dtype = np.dtype([
+  ("start", np.int64),
+  ("stop", np.int64),
+  ("swing_freq", np.float64),
+  ("lag", np.float64),
+  ("max_corr", np.float64),
+])
+
+def results_table(bins):
+  # all windows of all analyses in bins ({bin key: [SwingAnalysis]}) as one table,
+  # with the bin key, file index within the bin and window index of each row
+  parts = []
+  for bin_key, analyses in bins.items():
+    for file_i, analysis in enumerate(analyses):
+      part = np.empty(len(analysis.results), dtype=[
+        ("bin", np.asarray(bin_key).dtype),
+        ("file", np.int64),
+        ("window", np.int64),
+      ] + [(name, window_result_dtype[name]) for name in window_result_dtype.names])
+      part["bin"] = bin_key
+      part["file"] = file_i
+      part["window"] = np.arange(len(analysis.results))
+      for name in window_result_dtype.names:
+        part[name] = analysis.results[name]
+      parts.append(part)
+  return np.concatenate(parts) if parts else np.empty(0, dtype=[("bin", np.int64), ("file", np.int64), ("window", np.int64)] + window_result_dtype.descr)
+
+def group_by(keys, values):
+  # {key: values with that key}, in key order
+  order = np.argsort(keys, kind="stable")
+  unique_keys, starts = np.unique(keys[order], return_index=True)
+  return dict(zip(unique_keys.tolist(), np.split(values[order], starts[1:])))
+
+def lag_band(t_estimate_samp, allow_negative_lag=False):
+  # lags in [min_lag, max_lag) are plausible: up to half a swing period, and not negative unless allowed
+  min_lag = -round(t_estimate_samp/2) if allow_negative_lag else 0
+  max_lag = round(t_estimate_samp/2) - 1
+  return min_lag, max_lag
+
+def _pick_lag(corr, first_lag, min_lag, max_lag, corr_max=None, x=None, y=None):
+  # the peak of the unbiased correlation corr of x and y (at lags first_lag, first_lag+1, ...)
+  # within the lag band [min_lag, max_lag), as (index into corr, max_corr, scale) with
+  # max_corr = corr[index] / scale. in full mode corr_max, the highest correlation at any lag, is
+  # the scale; in bounded mode there is none, so the scale is the energy of x and y where they
+  # overlap at the peak, and max_corr is a correlation coefficient. either way max_corr <= 1
+  lo = max(min_lag - first_lag, 0)
+  hi = min(max_lag - first_lag, len(corr))
+  i = lo + int(np.argmax(corr[lo:hi]))
+  scale = corr_max if corr_max is not None else overlap_scale(x, y, first_lag + i)
+  return i, corr[i] / scale, scale
+
 def duration_to_samples(duration, sample_rate):
   if isinstance(duration, Number):
     return duration
@@ -82,15 +404,182 @@ def duration_to_samples(duration, sample_rate):
     sum += duration.samples
   return sum
 
+def refine_onsets(audio, onsets, search_before, search_after, energy_win_len=32, threshold=0.25, backtrack_threshold=0.01, block_len=1024):
+  # sample indices of onsets found on a coarse grid (sample indices too), moved to where they start.
+  # each onset is searched for in [onset - search_before, onset + search_after), but not past the
+  # midpoints to its neighbours: the energy over the last energy_win_len samples first rises
+  # threshold of the way from its floor (the median before the coarse onset) to its peak, and is
+  # then backtracked to the last sample at most backtrack_threshold of the way up.
+  # onsets are refined block_len at a time, each as one row of a 2-D array
+  onsets = np.unique(np.asarray(onsets, dtype=np.int64))
+  num_samples = audio.shape[-1]
+  if len(onsets) == 0:
+    return onsets
+
+  slice_len = search_before + search_after
+  pad_before = search_before + energy_win_len - 1
+  padded = np.concatenate((np.zeros(pad_before), audio.astype(np.float64), np.zeros(search_after)))
+  # energy row k ends at sample onset - search_before + k
+  rows = np.lib.stride_tricks.sliding_window_view(padded, slice_len + energy_win_len - 1)
+
+  midpoints = (onsets[:-1] + onsets[1:]) // 2
+  lo = np.maximum(onsets - search_before, np.concatenate(([onsets[0] - search_before], midpoints)))
+  hi = np.minimum(onsets + search_after, np.concatenate((midpoints, [onsets[-1] + search_after])))
+
+  refined = np.copy(onsets)
+  k = np.arange(slice_len)
+  for block_start in range(0, len(onsets), block_len):
+    block = slice(block_start, block_start + block_len)
+    base = onsets[block] - search_before
+    # starting the cumulative sum at 0 gives energy_win_len-sample sums by differencing
+    cumsum = np.zeros((len(base), slice_len + energy_win_len))
+    np.cumsum(rows[onsets[block]]**2, axis=-1, out=cumsum[:, 1:])
+    energy = cumsum[:, energy_win_len:] - cumsum[:, :-energy_win_len]
+
+    positions = base[:, np.newaxis] + k
+    valid = (positions >= lo[block, np.newaxis]) & (positions < hi[block, np.newaxis])
+    energy[~valid] = np.nan
+
+    floor = np.nanmedian(np.where(k < search_before, energy, np.nan), axis=-1)
+    peak = np.nanmax(energy, axis=-1)
+    rise = peak - floor
+    crossing = np.argmax(energy >= (floor + threshold * rise)[:, np.newaxis], axis=-1)
+    quiet = (energy <= (floor + backtrack_threshold * rise)[:, np.newaxis]) & (k < crossing[:, np.newaxis])
+    has_quiet = np.any(quiet, axis=-1)
+    last_quiet = slice_len - 1 - np.argmax(quiet[:, ::-1], axis=-1)
+
+    # onsets without a clear rise (or quiet start) stay where they were
+    found = (rise > 0) & has_quiet
+    refined[block][found] = base[found] + last_quiet[found] + 1
+
+  return np.clip(refined, 0, num_samples - 1)
+
+def detect_onsets(audio, sample_rate, onset_detect_kwargs={}, coarse_hop_length=None):
+  # librosa.onset.onset_detect(y=audio, sr=sample_rate, **onset_detect_kwargs). with a
+  # coarse_hop_length larger than the hop_length asked for, the onset strength is only computed at
+  # coarse_hop_length, and the onsets found are then refined to sample accuracy (see refine_onsets)
+  # and returned in the units asked for
+
+  # librosa takes a while to import, and only onset detection needs it
+  import librosa
+
+  hop_length = onset_detect_kwargs.get("hop_length", 512)
+  if coarse_hop_length is None or coarse_hop_length <= hop_length:
+    return librosa.onset.onset_detect(y=audio, sr=sample_rate, **onset_detect_kwargs)
+
+  coarse_kwargs = dict(onset_detect_kwargs, hop_length=coarse_hop_length, units="samples")
+  coarse_onsets = librosa.onset.onset_detect(y=audio, sr=sample_rate, **coarse_kwargs)
+  # an onset can start anywhere in the spectrogram frames around its coarse frame
+  margin = onset_detect_kwargs.get("n_fft", 2048) // 2 + 2*coarse_hop_length
+  onsets = refine_onsets(audio, coarse_onsets, margin, margin)
+
+  units = onset_detect_kwargs.get("units", "frames")
+  if units == "time":
+    return onsets / sample_rate
+  if units == "frames":
+    return onsets // hop_length
+  return onsets
+
+def onset_times(onsets, sample_rate, onset_detect_kwargs={}):
+  # onsets in seconds, whatever units onset_detect_kwargs asked for
+  units = onset_detect_kwargs.get("units", "frames")
+  if units == "time":
+    return np.asarray(onsets, dtype=np.float64)
+  if units == "frames":
+    return np.asarray(onsets) * onset_detect_kwargs.get("hop_length", 512) / sample_rate
+  return np.asarray(onsets) / sample_rate
+
+def pair_onsets(reference_onsets, onsets, tolerance):
+  # indices (reference_i, i) pairing each reference onset with the nearest of the (sorted) onsets,
+  # if that is at most tolerance away. each onset is paired at most once, with the reference onset
+  # nearest to it
+  reference_onsets = np.asarray(reference_onsets)
+  onsets = np.asarray(onsets)
+  if len(reference_onsets) == 0 or len(onsets) == 0:
+    return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+
+  right = np.clip(np.searchsorted(onsets, reference_onsets), 1, len(onsets) - 1) if len(onsets) > 1 else np.zeros(len(reference_onsets), dtype=np.int64)
+  left = np.maximum(right - 1, 0)
+  nearest = np.where(np.abs(onsets[right] - reference_onsets) < np.abs(onsets[left] - reference_onsets), right, left)
+  distance = np.abs(onsets[nearest] - reference_onsets)
+
+  reference_i = np.flatnonzero(distance <= tolerance)
+  i = nearest[reference_i]
+  # of reference onsets sharing an onset, keep the nearest
+  order = np.lexsort((distance[reference_i], i))
+  _, first = np.unique(i[order], return_index=True)
+  keep = np.sort(order[first])
+  return reference_i[keep], i[keep]
+
+def latency_stats(latencies):
+  latencies = np.asarray(latencies)
+  if len(latencies) == 0:
+    return SimpleNamespace(count=0, mean=np.nan, median=np.nan, stdev=np.nan, min=np.nan, max=np.nan, p5=np.nan, p95=np.nan)
+  p5, median, p95 = np.percentile(latencies, (5, 50, 95))
+  return SimpleNamespace(
+    count = len(latencies),
+    mean = np.mean(latencies),
+    median = median,
+    stdev = np.std(latencies),
+    min = np.min(latencies),
+    max = np.max(latencies),
+    p5 = p5,
+    p95 = p95
+  )
+
+class OnsetIndex:
+  # the onsets of several channels, merged in time order, remembering the channel each came from
+  # (channel) and its index among that channel's onsets (channel_i). lookups are binary searches
+  def __init__(self, channel_onsets, channels):
+    channel_onsets = [np.asarray(onsets) for onsets in channel_onsets]
+    self.channel_times = dict(zip(channels, channel_onsets))
+    times = np.concatenate(channel_onsets) if channel_onsets else np.zeros(0)
+    order = np.argsort(times, kind="stable")
+    self.times = times[order]
+    self.channel = np.repeat(np.asarray(channels), [len(onsets) for onsets in channel_onsets])[order]
+    self.channel_i = np.concatenate([np.arange(len(onsets)) for onsets in channel_onsets])[order] if channel_onsets else np.zeros(0, dtype=np.int64)
+
+  def __len__(self):
+    return len(self.times)
+
+  def at(self, t):
+    # index of the last onset at or before t, or None if there is none
+    i = int(np.searchsorted(self.times, t, side="right")) - 1
+    return i if i >= 0 else None
+
+  def between(self, t0, t1, channel=None):
+    # onset times in [t0, t1], of one channel or all; a view, not a copy
+    times = self.times if channel is None else self.channel_times[channel]
+    return times[np.searchsorted(times, t0, side="left"):np.searchsorted(times, t1, side="right")]
+
+def vline_segments(x, ymin, ymax):
+  # segments for a LineCollection of vertical lines at x, as one (len(x), 2, 2) array
+  segments = np.empty((len(x), 2, 2))
+  segments[:, :, 0] = np.asarray(x)[:, np.newaxis]
+  segments[:, 0, 1] = ymin
+  segments[:, 1, 1] = ymax
+  return segments
+
 class BonkChannelAnalysis:
-  def __init__(self, audio, sample_rate, onset_detect_kwargs={}):
+  def __init__(self, audio, sample_rate, onset_detect_kwargs={}, coarse_hop_length=None, cache=None, cache_key=None):
     self.audio = audio
     self.sample_rate = sample_rate
-    self.onsets = librosa.onset.onset_detect(y=audio, sr=self.sample_rate, **onset_detect_kwargs)
+    cached = cache.load(cache_key) if cache is not None else None
+    if cached is not None:
+      self.onsets = cached["onsets"]
+    else:
+      self.onsets = detect_onsets(audio, self.sample_rate, onset_detect_kwargs, coarse_hop_length)
+      if cache is not None:
+        cache.store(cache_key, {"onsets": self.onsets})
     self.abs_max_amplitude = np.abs(self.audio).max()
 
 class BonkAnalysis:
-  def __init__(self, audio, sample_rate, onset_detect_kwargs={}, channels=None):
+  default_pair_tolerance = 0.25
+
+  def __init__(self, audio, sample_rate, onset_detect_kwargs={}, coarse_hop_length=None, channels=None, reference_channel=None, pair_tolerance=None, cache=None, cache_source=None):
+    # with a cache, the onsets of each channel are stored under cache_source (see DiskCache.key).
+    # onsets of the reference channel (by default the first analyzed) are paired with the nearest
+    # onsets of each other channel, up to pair_tolerance seconds away
     # audio coming from librosa can have shape (num_channels, num_samples) or (num_samples,)
     is_1d = len(audio.shape) == 1
     self.num_channels = 1 if is_1d else audio.shape[0]
@@ -105,11 +594,42 @@ class BonkAnalysis:
     self.duration = self.num_samples * self.sample_duration
 
     self.channel_indices = channels if channels is not None else range(self.num_channels)
-    self.channels = [BonkChannelAnalysis(self.audio[i,:], self.sample_rate, onset_detect_kwargs) for i in self.channel_indices]
-    self.onsets = sortednp.kway_merge(*(channel_analysis.onsets for channel_analysis in self.channels))
+    if cache is None or cache_source is None:
+      cache = None
+    self.channels = [
+      BonkChannelAnalysis(self.audio[i,:], self.sample_rate, onset_detect_kwargs, coarse_hop_length,
+        cache=cache,
+        cache_key=cache.key(cache_source, "onsets", i, self.sample_rate, onset_detect_kwargs, coarse_hop_length) if cache is not None else None
+      )
+      for i in self.channel_indices
+    ]
+    self.onset_index = OnsetIndex([channel_analysis.onsets for channel_analysis in self.channels], self.channel_indices)
+    self.onsets = self.onset_index.times
     
     self.abs_max_amplitude = max(self.channels, key=lambda ca: ca.abs_max_amplitude).abs_max_amplitude
 
+    self.reference_channel = reference_channel if reference_channel is not None else self.channel_indices[0]
+    self.pair_tolerance = pair_tolerance if pair_tolerance is not None else self.default_pair_tolerance
+    reference_times = onset_times(self.channels[list(self.channel_indices).index(self.reference_channel)].onsets, self.sample_rate, onset_detect_kwargs)
+    # one entry per other channel. latencies (in seconds) are from each reference onset to its pair
+    self.pairs = []
+    for channel, channel_analysis in zip(self.channel_indices, self.channels):
+      if channel == self.reference_channel:
+        continue
+      times = onset_times(channel_analysis.onsets, self.sample_rate, onset_detect_kwargs)
+      reference_i, i = pair_onsets(reference_times, times, self.pair_tolerance)
+      latencies = times[i] - reference_times[reference_i]
+      self.pairs.append(SimpleNamespace(
+        channel = channel,
+        reference_i = reference_i,
+        i = i,
+        reference_times = reference_times[reference_i],
+        latencies = latencies,
+        unpaired_reference = len(reference_times) - len(reference_i),
+        unpaired = len(times) - len(i),
+        stats = latency_stats(latencies)
+      ))
+
 class SwingAnalysis:
   win_types = {
     "rect": lambda n: np.ones(n, dtype=np.float32),
@@ -120,57 +640,112 @@ class SwingAnalysis:
   env_methods = {
     "noop": lambda sig, **kwargs: sig,
     "rms": lambda sig, **kwargs: envelope_rms(sig, kwargs["rms_win_len"]),
-    "hilbert": lambda sig, **kwargs: envelope_hilbert(sig),
+    "rms_cumsum": lambda sig, **kwargs: envelope_rms_cumsum(sig, kwargs["rms_win_len"]),
+    "hilbert": lambda sig, **kwargs: envelope_hilbert(sig, planner=kwargs["planner"]),
   }
   default_mic_env_method = "rms"
   default_render_env_method = "hilbert"
+
+  dtypes = ("float32", "float64")
+  default_dtype = "float32"
+
+  corr_modes = ("full", "bounded")
+  default_corr_mode = "full"
+
+  # the swing frequency is estimated on the render envelope decimated to about this rate
+  swing_freq_target_rate = 1000
+
+  # the batched engine processes as many windows at once as fit in this many correlation samples, but
+  # at least one per FFT worker. on one core a batch costs what its windows do one at a time (the
+  # FFTs dominate, and cost the same per row); what batching buys is rows to spread across workers,
+  # since scipy splits a multi-row FFT by rows but can't split a single one
+  batch_max_samples = 2**20
   
-  def __init__(self, mic_sig, render_sig, sample_rate, rms_win_len, win_len=None, win_hop=None, win_type=None, mic_env_method=None, render_env_method=None, mic_env_invert=False, render_env_invert=False, env_trim=0, swing_freq=None, allow_negative_lag=False, path=None):
+  def __init__(self, mic_sig, render_sig, sample_rate, rms_win_len, win_len=None, win_hop=None, win_type=None, mic_env_method=None, render_env_method=None, mic_env_invert=False, render_env_invert=False, env_trim=0, swing_freq=None, swing_freq_decimate=None, swing_freq_drift_tolerance=None, allow_negative_lag=False, corr_mode=None, batch=False, batch_size=None, precompute_envs=False, decimate=1, include_signals=False, signals_loader=None, dtype=None, overwrite_input=False, fft_planner=None, cache=None, cache_source=None, path=None, verbose=False, profiler=None):
+    # mic_sig and render_sig can be None if there's a signals_loader; they're then only loaded
+    # when the results aren't in the cache. signals_loader(start, stop) returns samples [start, stop)
+    # of both signals (all of them for None)
     self.path = path
     self.filename = os.path.basename(self.path) if self.path else "<no filename>"
 
     self.sample_rate = sample_rate
     self.sample_duration = 1.0 / sample_rate
-    self.num_samples = len(mic_sig)
-    self.duration = self.num_samples * self.sample_duration
-    self.win_len = duration_to_samples(win_len, self.sample_rate) if win_len is not None else self.num_samples
-    self.win_len_s = self.win_len / self.sample_rate
-    self.win_hop = duration_to_samples(win_hop, self.sample_rate) if win_hop is not None else self.win_len
     self.win_type = win_type if win_type is not None else self.default_win_type
-    self.win = self.win_types[self.win_type](self.win_len)
     self.mic_env_method = mic_env_method if mic_env_method is not None else self.default_mic_env_method
     self.render_env_method = render_env_method if render_env_method is not None else self.default_render_env_method
     self.mic_env_invert = mic_env_invert
     self.render_env_invert = render_env_invert
     self.swing_freq = swing_freq
+    self.swing_freq_decimate = swing_freq_decimate if swing_freq_decimate is not None else max(1, int(self.sample_rate // self.swing_freq_target_rate))
+    self.swing_freq_drift_tolerance = swing_freq_drift_tolerance
     self.allow_negative_lag = allow_negative_lag
+    self.corr_mode = corr_mode if corr_mode is not None else self.default_corr_mode
+    if self.corr_mode not in self.corr_modes:
+      raise ValueError(f"unknown correlation mode: {self.corr_mode}")
+    self.batch = batch
+    self.batch_size = batch_size
+    self.precompute_envs = precompute_envs
+    self.decimate = decimate
+    self.include_signals = include_signals
+    # signals, envelopes and correlations are all kept in this dtype
+    self.dtype = np.dtype(dtype if dtype is not None else self.default_dtype)
+    # the input signals may be normalized in place instead of copied
+    self.overwrite_input = overwrite_input
+    self.signals_loader = signals_loader
+    # shared between analyses, so measured correlation methods carry over from file to file
+    self.fft_planner = fft_planner if fft_planner is not None else default_fft_planner
     self.rms_win_len = duration_to_samples(rms_win_len, self.sample_rate)
     self.env_trim = duration_to_samples(env_trim, self.sample_rate)
+    # progress is only printed when verbose (parallel analyses would interleave it); stage costs go
+    # to the profiler
+    self.verbose = verbose
+    self.profiler = profiler if profiler is not None else null_profiler
     
     # self.trim_win_len = 30 * self.sample_rate + 2*self.env_trim
-    
-    print("normalize mic")
-    self.mic_sig = mic_sig
-    self.mic_sig = self.mic_sig / np.max(np.abs(self.mic_sig))
 
-    print("normalize render")
-    self.render_sig = render_sig
-    self.render_sig = self.render_sig / np.max(np.abs(self.render_sig))
+    # cache_source describes where the signals come from (see DiskCache.key)
+    self.cache = cache
+    self.cache_key = None
+    cached = None
+    if self.cache is not None and cache_source is not None:
+      self.cache_key = self.cache.key(cache_source, self._cache_params(win_len, win_hop))
+      # kept signals aren't cached, so they have to be computed anyway
+      if not self.include_signals:
+        cached = self.cache.load(self.cache_key)
 
-    self.results = []
-    
-    start = 0
-    print(f"num_samples = {self.num_samples}")
-    while True:
-      stop = start + self.win_len
-      if stop > self.num_samples:
-        break
-      
-      print(f"start:stop = {start}:{stop}")
-      self.results.append(self.analyze_window(start, stop))
-      start += self.win_hop
+    if cached is None and mic_sig is None:
+      mic_sig, render_sig = self._load_signals()
 
-    lags = np.array([r.lag for r in self.results], dtype=np.float32)
+    self.num_samples = int(cached["num_samples"]) if cached is not None else len(mic_sig)
+    self.duration = self.num_samples * self.sample_duration
+    self.win_len = duration_to_samples(win_len, self.sample_rate) if win_len is not None else self.num_samples
+    self.win_len_s = self.win_len / self.sample_rate
+    self.win_hop = duration_to_samples(win_hop, self.sample_rate) if win_hop is not None else self.win_len
+
+    # results is a table with window_result_dtype columns. kept_signals holds the full
+    # analyze_window results when include_signals is set
+    self.kept_signals = None
+    self.swing_freq_estimate = None
+    # the peaks the signals were normalized by, so windows loaded again come out the same
+    self.signal_scales = None
+
+    if cached is not None:
+      self._log(f"use cached results for {self.filename}")
+      self._restore_cached(cached)
+      if mic_sig is not None:
+        self._prepare_signals(mic_sig, render_sig)
+      else:
+        self._release_signals()
+    else:
+      self._analyze(mic_sig, render_sig)
+      if self.cache_key is not None:
+        self.cache.store(self.cache_key, self._cached_arrays())
+
+    # signals can be loaded again for window_signals, so don't hold on to them
+    if self.signals_loader is not None:
+      self._release_signals()
+
+    lags = self.results["lag"].astype(np.float32)
 
     self.lag_sum = np.sum(lags)
     self.count = len(self.results)
@@ -179,82 +754,294 @@ class SwingAnalysis:
 
     # print(f"lags mean = {self.mean}, stdev = {self.stdev}")
 
-  def analyze_window(self, start, stop, include_signals=True):
-    mic_sig = self.mic_sig[start:stop]
-    render_sig = self.render_sig[start:stop]
+  def _log(self, *args, **kwargs):
+    if self.verbose:
+      print(*args, **kwargs)
 
-    env_kwargs = {"rms_win_len": self.rms_win_len}
-    
-    print(f"compute mic envelope (method: {self.mic_env_method})")
-    mic_env = self.env_methods[self.mic_env_method](mic_sig, **env_kwargs)
+  def _load_signals(self, start=None, stop=None):
+    with self.profiler.stage("load"):
+      return self.signals_loader(start, stop)
+
+  @property
+  def win(self):
+    return self.win_types[self.win_type](self.win_len).astype(self.dtype, copy=False)
+
+  def _analyze(self, mic_sig, render_sig):
+    self._prepare_signals(mic_sig, render_sig)
+
+    # the swing rate of a recording doesn't change, so estimate it once for the whole file
+    if self.swing_freq is None:
+      with self.profiler.stage("envelope"):
+        if self.render_env_full is not None:
+          render_env = self._normalize_envelope(trim_edges(self.render_env_full, self.env_trim), self.render_env_invert)
+        else:
+          render_env = self._render_envelope(self.render_sig)
+      with self.profiler.stage("swing_freq"):
+        self.swing_freq_estimate = estimate_swing_freq(render_env, self.sample_rate, decimate=self.swing_freq_decimate, planner=self.fft_planner)
+      self._log(f"swing frequency: {self.swing_freq_estimate.freq:.03} Hz")
+
+    self._log(f"num_samples = {self.num_samples}")
+    if self.batch:
+      self.results = self.analyze_windows_batched()
+    else:
+      rows = []
+      kept_signals = []
+      start = 0
+      while True:
+        stop = start + self.win_len
+        if stop > self.num_samples:
+          break
+      
+        self._log(f"start:stop = {start}:{stop}")
+        result = self.analyze_window(start, stop, include_signals=self.include_signals)
+        rows.append(tuple(getattr(result, name) for name in window_result_dtype.names))
+        kept_signals.append(result)
+        start += self.win_hop
+
+      self.results = np.array(rows, dtype=window_result_dtype)
+      if self.include_signals:
+        self.kept_signals = kept_signals
+
+  def _cache_params(self, win_len, win_hop):
+    # everything besides the signals that the results depend on
+    return {
+      "sample_rate": self.sample_rate,
+      "rms_win_len": self.rms_win_len,
+      "win_len": duration_to_samples(win_len, self.sample_rate) if win_len is not None else None,
+      "win_hop": duration_to_samples(win_hop, self.sample_rate) if win_hop is not None else None,
+      "mic_env_method": self.mic_env_method,
+      "render_env_method": self.render_env_method,
+      "mic_env_invert": bool(self.mic_env_invert),
+      "render_env_invert": bool(self.render_env_invert),
+      "env_trim": self.env_trim,
+      "swing_freq": self.swing_freq,
+      "swing_freq_decimate": self.swing_freq_decimate,
+      "swing_freq_drift_tolerance": self.swing_freq_drift_tolerance,
+      "allow_negative_lag": bool(self.allow_negative_lag),
+      "corr_mode": self.corr_mode,
+      "batch": bool(self.batch),
+      "precompute_envs": bool(self.precompute_envs),
+      "decimate": self.decimate,
+      "dtype": self.dtype.name,
+    }
+
+  def _cached_arrays(self):
+    arrays = {
+      "results": self.results,
+      "num_samples": np.int64(self.num_samples),
+    }
+    if self.swing_freq_estimate is not None:
+      arrays["swing_freq_estimate"] = np.array([self.swing_freq_estimate.freq, self.swing_freq_estimate.n_fft, self.swing_freq_estimate.sample_rate, self.swing_freq_estimate.decimate])
+    if self.signal_scales is not None:
+      arrays["signal_scales"] = np.array(self.signal_scales)
+    return arrays
+
+  def _restore_cached(self, cached):
+    self.results = cached["results"]
+    if "signal_scales" in cached:
+      self.signal_scales = tuple(cached["signal_scales"].tolist())
+    if "swing_freq_estimate" in cached:
+      freq, n_fft, sample_rate, decimate = cached["swing_freq_estimate"]
+      self.swing_freq_estimate = SimpleNamespace(
+        freq = freq,
+        spectrum = None,
+        n_fft = int(n_fft),
+        sample_rate = sample_rate,
+        decimate = int(decimate)
+      )
+
+  def _normalize_signal(self, sig, scale):
+    if self.overwrite_input and sig.dtype == self.dtype and sig.flags.writeable:
+      sig /= scale
+      return sig
+    return np.asarray(sig, dtype=self.dtype) / scale
+
+  def _prepare_signals(self, mic_sig, render_sig, scales=None):
+    # scales are the peaks to divide by, the signals' own by default
+    with self.profiler.stage("normalize"):
+      if scales is None:
+        scales = (abs_max(np.asarray(mic_sig, dtype=self.dtype)), abs_max(np.asarray(render_sig, dtype=self.dtype)))
+      self.signal_scales = scales
+
+      self._log("normalize mic")
+      self.mic_sig = self._normalize_signal(mic_sig, scales[0])
+
+      self._log("normalize render")
+      self.render_sig = self._normalize_signal(render_sig, scales[1])
+
+    # with precompute_envs, windows slice these instead of computing envelopes over overlapping samples
+    self.mic_env_full = None
+    self.render_env_full = None
+    if self.precompute_envs:
+      with self.profiler.stage("envelope"):
+        self._log(f"compute mic envelope for whole file (method: {self.mic_env_method})")
+        self.mic_env_full = self._envelope(self.mic_sig, self.mic_env_method)
+        self._log(f"compute render envelope for whole file (method: {self.render_env_method})")
+        self.render_env_full = self._envelope(self.render_sig, self.render_env_method)
+
+  def _release_signals(self):
+    self.mic_sig = None
+    self.render_sig = None
+    self.mic_env_full = None
+    self.render_env_full = None
+    if self.swing_freq_estimate is not None:
+      self.swing_freq_estimate.spectrum = None
+
+  def window_signals(self, result_i):
+    # the result for window result_i, with the signals it was computed from
+    if self.kept_signals is not None:
+      return self.kept_signals[result_i]
+
+    start = int(self.results["start"][result_i])
+    stop = int(self.results["stop"][result_i])
+    if self.mic_sig is not None:
+      return self.analyze_window(start, stop)
+
+    # load just the window. with precompute_envs, also the margin its slice of the whole-file
+    # envelopes depends on, and compute those envelopes over the loaded samples only. that's exact
+    # for RMS envelopes, but a Hilbert envelope depends a little on the whole file (about 1e-3 of
+    # its peak), so the lag can come out a sample off the analysis'
+    margin = self.rms_win_len + self.env_trim if self.precompute_envs else 0
+    lo = max(start - margin, 0)
+    hi = min(stop + margin, self.num_samples)
+    self._log(f"reload samples {lo}:{hi} of {self.filename}")
+    self._prepare_signals(*self._load_signals(lo, hi), scales=self.signal_scales)
+    try:
+      result = self.analyze_window(start - lo, stop - lo)
+    finally:
+      self._release_signals()
+    result.start = start
+    result.stop = stop
+    return result
+
+  def _envelope(self, sig, method):
+    env_kwargs = {"rms_win_len": self.rms_win_len, "planner": self.fft_planner}
+    return self.env_methods[method](sig, **env_kwargs)
+
+  @staticmethod
+  def _normalize_envelope(env, invert, inplace=False):
+    env = peak_normalize(env, inplace=inplace)
+    if invert:
+      np.negative(env, out=env)
+    return env
+
+  def _mic_envelope(self, mic_sig):
+    mic_env = self._envelope(mic_sig, self.mic_env_method)
     mic_env = trim_edges(mic_env, self.env_trim)
-    mic_env = peak_normalize(mic_env)
-    if self.mic_env_invert:
-      mic_env = -mic_env
-    
-    print(f"compute render envelope (method: {self.render_env_method})")
-    render_env = self.env_methods[self.render_env_method](render_sig, **env_kwargs)
+    # the envelope is a new array, unless the method is noop
+    return self._normalize_envelope(mic_env, self.mic_env_invert, inplace=not np.may_share_memory(mic_env, mic_sig))
+
+  def _render_envelope(self, render_sig):
+    render_env = self._envelope(render_sig, self.render_env_method)
     render_env = trim_edges(render_env, self.env_trim)
-    render_env = peak_normalize(render_env)
-    if self.render_env_invert:
-      render_env = -render_env
+    return self._normalize_envelope(render_env, self.render_env_invert, inplace=not np.may_share_memory(render_env, render_sig))
 
-    if self.swing_freq is None:
-      print("find swing frequency... ", end="")
+  def _window_envelopes(self, start, stop):
+    if self.precompute_envs:
+      # the span a per-window envelope covers after trimming; only the file edges were trimmed
+      mic_env = self.mic_env_full[start+self.env_trim:stop-self.env_trim]
+      render_env = self.render_env_full[start+self.env_trim:stop-self.env_trim]
+      return (
+        self._normalize_envelope(mic_env, self.mic_env_invert),
+        self._normalize_envelope(render_env, self.render_env_invert)
+      )
+
+    self._log(f"compute mic envelope (method: {self.mic_env_method})")
+    mic_env = self._mic_envelope(self.mic_sig[start:stop])
+    
+    self._log(f"compute render envelope (method: {self.render_env_method})")
+    render_env = self._render_envelope(self.render_sig[start:stop])
 
-      n_fft = 2**23
-      fax = scipy.fft.rfftfreq(n_fft, 1/self.sample_rate)
-      fft = scipy.fft.fft(render_env, n_fft)
-      fft_nonneg = fft[:len(fax)]
-      # ignore very low frequencies
-      fft_nonneg[fax < 0.2] = 0.0
+    return mic_env, render_env
 
-      i_max = np.argmax(np.abs(fft_nonneg))
-      swing_freq = fax[i_max]
+  def _window_swing_freq(self, render_env):
+    # render_env is only looked at when checking for drift
+    if self.swing_freq is not None:
+      self._log(f"use given swing frequency: {self.swing_freq:.03} Hz")
+      return self.swing_freq
 
-      print(f"{swing_freq:.03} Hz")
+    swing_freq = self.swing_freq_estimate.freq
+    if self.swing_freq_drift_tolerance is not None:
+      # cheap check on the decimated window envelope
+      window_freq = estimate_swing_freq(render_env, self.sample_rate, decimate=self.swing_freq_decimate, planner=self.fft_planner).freq
+      drift = abs(window_freq - swing_freq) / swing_freq
+      if drift > self.swing_freq_drift_tolerance:
+        print(f"{self.filename}: swing frequency drifted to {window_freq:.03} Hz ({drift*100:.01f}%), using window estimate")
+        swing_freq = window_freq
+    return swing_freq
 
-      f_estimate = fax[i_max+1]
-    else:
-      swing_freq = self.swing_freq
-      print(f"use given swing frequency: {swing_freq:.03} Hz")
-      f_estimate = swing_freq
+  def _lag_band(self, t_estimate_samp):
+    return lag_band(t_estimate_samp, self.allow_negative_lag)
+
+  def analyze_window(self, start, stop, include_signals=True):
+    mic_sig = self.mic_sig[start:stop]
+    render_sig = self.render_sig[start:stop]
 
-    t_estimate = 1/f_estimate
+    with self.profiler.stage("envelope", start, stop):
+      mic_env, render_env = self._window_envelopes(start, stop)
+
+    with self.profiler.stage("swing_freq", start, stop):
+      swing_freq = self._window_swing_freq(render_env)
+
+    t_estimate = 1/swing_freq
     t_estimate_samp = np.ceil(t_estimate * self.sample_rate)
       
-    print("correlate")
+    min_lag, max_lag = self._lag_band(t_estimate_samp)
 
-    corr, lags = xcorr_unbiased(render_env, mic_env)
-    
-    corr = corr / np.max(corr)
+    # the coarse-to-fine search picks its peak as it goes, so that's all counted as correlation
+    with self.profiler.stage("correlate", start, stop):
+      if self.decimate > 1:
+        self._log(f"correlate (coarse to fine, decimation: {self.decimate})")
 
-    corr_raw = np.copy(corr)
-    
-    corr_win_size_half = round(t_estimate_samp/4)
-    # corr[:self.trim_win_len - t_estimate_samp_quarter] = 0.0
-    # corr[self.trim_win_len + t_estimate_samp_quarter - 1:] = 0.0
-    
-    zero_i = len(lags)//2
-    left_clear_stop_i = zero_i
-    if self.allow_negative_lag:
-      left_clear_stop_i -= round(t_estimate_samp/2)
-    right_clear_start_i = zero_i + round(t_estimate_samp/2) - 1
-    # corr[:zero_i - corr_win_size_half] = 0.0
-    # corr[zero_i + corr_win_size_half - 1:] = 0.0
-    corr[:left_clear_stop_i] = -1.0
-    corr[right_clear_start_i:] = -1.0
+        # the swing frequency spectrum of a whole-file window can serve the coarse search
+        estimate = self.swing_freq_estimate
+        reuse = estimate is not None and estimate.spectrum is not None and estimate.decimate == self.decimate and start == 0 and stop == self.num_samples
+        search = xcorr_coarse_to_fine(
+          render_env, mic_env, min_lag, max_lag, self.decimate,
+          x_spectrum=estimate.spectrum if reuse else None,
+          n_fft=estimate.n_fft if reuse else None,
+          planner=self.fft_planner
+        )
+        corr = search.corr
+        corr_raw = corr
+        lags = search.lags
+      elif self.corr_mode == "bounded":
+        self._log(f"correlate (mode: {self.corr_mode})")
+        corr, lags = xcorr_unbiased_bounded(render_env, mic_env, min_lag, max_lag, planner=self.fft_planner)
+      else:
+        self._log(f"correlate (mode: {self.corr_mode})")
+
+        # a window spanning the whole file has the same render envelope the swing frequency was estimated on
+        estimate = self.swing_freq_estimate
+        if estimate is not None and estimate.spectrum is not None and estimate.decimate == 1 and start == 0 and stop == self.num_samples:
+          corr, lags = xcorr_unbiased(render_env, mic_env, x_spectrum=estimate.spectrum, n_fft=estimate.n_fft, planner=self.fft_planner)
+        else:
+          corr, lags = xcorr_unbiased(render_env, mic_env, planner=self.fft_planner)
     
     corr_lags = lags
     corr_lags_s = lags / self.sample_rate
     
-    i_max_corr = np.argmax(corr)
+    if self.decimate > 1:
+      lag = search.lag / self.sample_rate
+      max_corr = search.peak
+    else:
+      with self.profiler.stage("peak_pick", start, stop):
+        if self.corr_mode == "bounded":
+          i_max_corr, max_corr, corr_scale = _pick_lag(corr, lags[0], min_lag, max_lag, x=render_env, y=mic_env)
+        else:
+          i_max_corr, max_corr, corr_scale = _pick_lag(corr, lags[0], min_lag, max_lag, corr_max=np.max(corr))
+        lag = corr_lags_s[i_max_corr]
 
-    # lag = (i_max_corr - self.trim_win_len) / self.sample_rate
-    lag = corr_lags_s[i_max_corr]
-    max_corr = corr[i_max_corr]
+        corr /= corr_scale
+        corr_raw = corr
+        if self.corr_mode != "bounded":
+          # only the band counts, so blank out the rest (corr_raw keeps it for the plots)
+          corr_raw = np.copy(corr)
+          zero_i = len(lags)//2
+          corr[:max(zero_i + min_lag, 0)] = -1.0
+          corr[zero_i + max_lag:] = -1.0
     
-    print("lag:", lag)
+    self._log("lag:", lag)
 
     mic_sig = trim_edges(mic_sig, self.env_trim)
     render_sig = trim_edges(render_sig, self.env_trim)
@@ -278,3 +1065,267 @@ class SwingAnalysis:
       max_corr = max_corr,
       **signals
     )
+
+  def analyze_windows_batched(self):
+    # all windows as rows of a strided view of the signals (no copies)
+    num_windows = (self.num_samples - self.win_len) // self.win_hop + 1 if self.num_samples >= self.win_len else 0
+    env_len = self.win_len - 2*self.env_trim
+    if self.precompute_envs:
+      mic_rows = np.lib.stride_tricks.sliding_window_view(self.mic_env_full[self.env_trim:], env_len)[::self.win_hop]
+      render_rows = np.lib.stride_tricks.sliding_window_view(self.render_env_full[self.env_trim:], env_len)[::self.win_hop]
+    else:
+      mic_rows = np.lib.stride_tricks.sliding_window_view(self.mic_sig, self.win_len)[::self.win_hop]
+      render_rows = np.lib.stride_tricks.sliding_window_view(self.render_sig, self.win_len)[::self.win_hop]
+
+    # sized for full correlations, the longest kind
+    n_fft = self.fft_planner.fast_len(2*env_len - 1)
+    batch_size = self.batch_size if self.batch_size is not None else max(1, self.fft_planner.num_workers, self.batch_max_samples // n_fft)
+
+    results = np.zeros(num_windows, dtype=window_result_dtype)
+    results["start"] = np.arange(num_windows) * self.win_hop
+    results["stop"] = results["start"] + self.win_len
+    for batch_start in range(0, num_windows, batch_size):
+      batch_stop = min(batch_start + batch_size, num_windows)
+      self._log(f"windows {batch_start}:{batch_stop} of {num_windows}")
+      # the sample range the batch covers, for the profiler
+      span = (int(results["start"][batch_start]), int(results["stop"][batch_stop-1]))
+
+      # the rows are independent, so their FFTs split well across the planner's workers
+      with self.profiler.stage("envelope", *span):
+        if self.precompute_envs:
+          mic_env = self._normalize_envelope(mic_rows[batch_start:batch_stop], self.mic_env_invert)
+          render_env = self._normalize_envelope(render_rows[batch_start:batch_stop], self.render_env_invert)
+        else:
+          mic_env = self._mic_envelope(mic_rows[batch_start:batch_stop])
+          render_env = self._render_envelope(render_rows[batch_start:batch_stop])
+
+      with self.profiler.stage("swing_freq", *span):
+        swing_freqs = np.array([self._window_swing_freq(row) for row in render_env]) if self.swing_freq_drift_tolerance is not None else np.full(len(render_env), self._window_swing_freq(None))
+      t_estimate_samps = np.ceil(1/swing_freqs * self.sample_rate)
+
+      if self.decimate > 1:
+        # the coarse-to-fine search is already close to linear in the window length
+        lags = np.zeros(len(render_env))
+        max_corrs = np.zeros(len(render_env))
+        with self.profiler.stage("correlate", *span):
+          for row_i, t_estimate_samp in enumerate(t_estimate_samps):
+            min_lag, max_lag = self._lag_band(t_estimate_samp)
+            search = xcorr_coarse_to_fine(render_env[row_i], mic_env[row_i], min_lag, max_lag, self.decimate, planner=self.fft_planner)
+            lags[row_i] = search.lag
+            max_corrs[row_i] = search.peak
+      else:
+        lags, max_corrs = self._correlate_rows(render_env, mic_env, t_estimate_samps, span)
+
+      results["swing_freq"][batch_start:batch_stop] = swing_freqs
+      results["lag"][batch_start:batch_stop] = lags / self.sample_rate
+      results["max_corr"][batch_start:batch_stop] = max_corrs
+
+    return results
+
+  def _correlate_rows(self, render_env, mic_env, t_estimate_samps, span=(-1, -1)):
+    env_len = render_env.shape[-1]
+    bands = [self._lag_band(t_estimate_samp) for t_estimate_samp in t_estimate_samps]
+    bands = [(max(min_lag, -(env_len - 1)), min(max_lag, env_len)) for min_lag, max_lag in bands]
+
+    # correlate every row at once (in double precision, like xcorr_unbiased).
+    # circular layout: lag k >= 0 at k, lag k < 0 at n_fft+k
+    with self.profiler.stage("correlate", *span):
+      planner = self.fft_planner
+      if self.corr_mode == "bounded":
+        # only the bands are needed, and a circular correlation is exact for lags within
+        # n_fft - env_len of zero, so it can be shorter than the full 2*env_len - 1
+        reach = max(max(-min_lag, max_lag) for min_lag, max_lag in bands)
+        n_fft = planner.fast_len(env_len + reach)
+      else:
+        n_fft = planner.fast_len(2*env_len - 1)
+      spectrum = planner.rfft(render_env.astype(np.float64, copy=False), n_fft)
+      mic_spectrum = planner.rfft(mic_env.astype(np.float64, copy=False), n_fft)
+      spectrum *= np.conj(mic_spectrum, out=mic_spectrum)
+      mic_spectrum = None
+      circ = planner.irfft(spectrum, n_fft)
+      spectrum = None
+
+      if self.corr_mode != "bounded":
+        circ[:, :env_len] /= env_len - np.arange(env_len)
+        circ[:, n_fft-(env_len-1):] /= np.arange(1, env_len)
+        corr_maxs = np.maximum(np.max(circ[:, :env_len], axis=-1), np.max(circ[:, n_fft-(env_len-1):], axis=-1, initial=-np.inf))
+
+    # pick each row's peak within its lag band
+    lags = np.zeros(len(circ))
+    max_corrs = np.zeros(len(circ))
+    with self.profiler.stage("peak_pick", *span):
+      for row_i, (min_lag, max_lag) in enumerate(bands):
+        band = np.concatenate((circ[row_i, n_fft+min_lag:], circ[row_i, :max_lag])) if min_lag < 0 else circ[row_i, min_lag:max_lag]
+        if self.corr_mode == "bounded":
+          band = band / (env_len - np.abs(np.arange(min_lag, max_lag)))
+          i_max_corr, max_corrs[row_i], _ = _pick_lag(band, min_lag, min_lag, max_lag, x=render_env[row_i], y=mic_env[row_i])
+        else:
+          i_max_corr, max_corrs[row_i], _ = _pick_lag(band, min_lag, min_lag, max_lag, corr_max=corr_maxs[row_i])
+        lags[row_i] = min_lag + i_max_corr
+
+    return lags, max_corrs
+
+class SampleBuffer:
+  # the most recent samples of a few channels, with absolute sample indices. the samples live in a
+  # preallocated array and are only moved to its front when appending would run past the end, so
+  # any kept span is a contiguous slice
+  def __init__(self, num_channels, capacity, dtype):
+    self.data = np.zeros((num_channels, capacity), dtype=dtype)
+    self.start = 0
+    self.lo = 0
+    self.hi = 0
+
+  @property
+  def stop(self):
+    return self.start + self.hi - self.lo
+
+  def append(self, samples):
+    num_new = samples.shape[-1]
+    if self.hi + num_new > self.data.shape[-1]:
+      num_kept = self.hi - self.lo
+      if num_kept + num_new > self.data.shape[-1]:
+        # blocks larger than expected
+        data = np.zeros((self.data.shape[0], max(2*self.data.shape[-1], num_kept + num_new)), dtype=self.data.dtype)
+      else:
+        data = self.data
+      data[:, :num_kept] = self.data[:, self.lo:self.hi]
+      self.data = data
+      self.lo = 0
+      self.hi = num_kept
+    self.data[:, self.hi:self.hi+num_new] = samples
+    self.hi += num_new
+
+  def get(self, start, stop):
+    assert self.start <= start <= stop <= self.stop, f"{start}:{stop} not in {self.start}:{self.stop}"
+    return self.data[:, self.lo+start-self.start:self.lo+stop-self.start]
+
+  def discard_before(self, index):
+    num_dropped = min(max(index - self.start, 0), self.hi - self.lo)
+    self.lo += num_dropped
+    self.start += num_dropped
+
+class SwingStream:
+  # windowed swing analysis of audio that arrives in blocks, e.g. while recording. blocks are
+  # (num_frames, num_channels) arrays of interleaved audio; every win_hop samples one window result
+  # comes out, like a row of SwingAnalysis.results. only about a window of envelopes is kept.
+  #
+  # envelopes are computed block by block, with env_context samples of signal on either side, and
+  # windows are sliced from them like SwingAnalysis does with precompute_envs. with enough context
+  # (the default covers the rms window) the rms and noop envelopes are exactly those of the whole
+  # signal; the hilbert envelope is an approximation near block boundaries. without a given
+  # swing_freq, the swing frequency is estimated on the first window.
+
+  def __init__(self, sample_rate, rms_win_len, win_len, win_hop=None, mic_channel=0, render_channel=1, mic_env_method=None, render_env_method=None, mic_env_invert=False, render_env_invert=False, env_trim=0, env_context=None, swing_freq=None, swing_freq_decimate=None, swing_freq_drift_tolerance=None, allow_negative_lag=False, corr_mode=None, decimate=1, dtype=None, fft_planner=None):
+    self.sample_rate = sample_rate
+    self.win_len = duration_to_samples(win_len, self.sample_rate)
+    self.win_hop = duration_to_samples(win_hop, self.sample_rate) if win_hop is not None else self.win_len
+    self.mic_channel = mic_channel
+    self.render_channel = render_channel
+    self.mic_env_method = mic_env_method if mic_env_method is not None else SwingAnalysis.default_mic_env_method
+    self.render_env_method = render_env_method if render_env_method is not None else SwingAnalysis.default_render_env_method
+    self.mic_env_invert = mic_env_invert
+    self.render_env_invert = render_env_invert
+    self.rms_win_len = duration_to_samples(rms_win_len, self.sample_rate)
+    self.env_trim = duration_to_samples(env_trim, self.sample_rate)
+    self.env_context = duration_to_samples(env_context, self.sample_rate) if env_context is not None else max(self.rms_win_len, self.env_trim)
+    self.swing_freq = swing_freq
+    self.swing_freq_decimate = swing_freq_decimate if swing_freq_decimate is not None else max(1, int(self.sample_rate // SwingAnalysis.swing_freq_target_rate))
+    self.swing_freq_drift_tolerance = swing_freq_drift_tolerance
+    self.allow_negative_lag = allow_negative_lag
+    self.corr_mode = corr_mode if corr_mode is not None else SwingAnalysis.default_corr_mode
+    if self.corr_mode not in SwingAnalysis.corr_modes:
+      raise ValueError(f"unknown correlation mode: {self.corr_mode}")
+    self.decimate = decimate
+    self.dtype = np.dtype(dtype if dtype is not None else SwingAnalysis.default_dtype)
+    self.fft_planner = fft_planner if fft_planner is not None else default_fft_planner
+
+    if self.win_len <= 2*self.env_trim:
+      raise ValueError(f"window of {self.win_len} samples is all trim")
+
+    # mic and render signals not yet turned into envelopes (plus context), and envelopes of windows to come
+    self.sigs = SampleBuffer(2, self.win_len + 4*self.env_context, self.dtype)
+    self.envs = SampleBuffer(2, 2*self.win_len, self.dtype)
+    self.num_samples = 0
+    self.window_start = 0
+    self.swing_freq_estimate = None
+
+  def process(self, blocks):
+    for block in blocks:
+      yield from self.push(block)
+    yield from self.finish()
+
+  def push(self, block):
+    # results of the windows this block completes
+    block = np.asarray(block)
+    self.sigs.append(np.stack((block[:, self.mic_channel], block[:, self.render_channel])).astype(self.dtype, copy=False))
+    self.num_samples += len(block)
+    # envelopes are computed once the next window can be completed, so the context is only
+    # processed again once per window rather than once per block
+    if self.num_samples - self.env_context < self.window_start + self.win_len - self.env_trim:
+      return []
+    self._update_envelopes(self.num_samples - self.env_context)
+    return self._analyze_ready_windows()
+
+  def finish(self):
+    # at the end of the stream, the signals are zero-padded like at the end of a file
+    self._update_envelopes(self.num_samples)
+    return self._analyze_ready_windows()
+
+  def _update_envelopes(self, stop):
+    # envelopes of samples envs.stop..stop, from the signals with context on either side
+    start = self.envs.stop
+    if stop <= start:
+      return
+    sigs = self.sigs.get(max(start - self.env_context, self.sigs.start), min(stop + self.env_context, self.num_samples))
+    offset = start - max(start - self.env_context, self.sigs.start)
+    mic_env = SwingAnalysis.env_methods[self.mic_env_method](sigs[0], rms_win_len=self.rms_win_len, planner=self.fft_planner)
+    render_env = SwingAnalysis.env_methods[self.render_env_method](sigs[1], rms_win_len=self.rms_win_len, planner=self.fft_planner)
+    self.envs.append(np.stack((mic_env[offset:offset+stop-start], render_env[offset:offset+stop-start])))
+    self.sigs.discard_before(stop - self.env_context)
+
+  def _analyze_ready_windows(self):
+    results = []
+    while self.window_start + self.win_len <= self.num_samples and self.window_start + self.win_len - self.env_trim <= self.envs.stop:
+      results.append(self._analyze_window(self.window_start, self.window_start + self.win_len))
+      self.window_start += self.win_hop
+      self.envs.discard_before(self.window_start + self.env_trim)
+    return results
+
+  def _analyze_window(self, start, stop):
+    mic_env, render_env = self.envs.get(start + self.env_trim, stop - self.env_trim)
+    mic_env = SwingAnalysis._normalize_envelope(mic_env, self.mic_env_invert)
+    render_env = SwingAnalysis._normalize_envelope(render_env, self.render_env_invert)
+
+    swing_freq = self.swing_freq
+    if swing_freq is None:
+      if self.swing_freq_estimate is None or self.swing_freq_drift_tolerance is not None:
+        window_freq = estimate_swing_freq(render_env, self.sample_rate, decimate=self.swing_freq_decimate, planner=self.fft_planner).freq
+        if self.swing_freq_estimate is None:
+          self.swing_freq_estimate = window_freq
+        elif abs(window_freq - self.swing_freq_estimate) / self.swing_freq_estimate > self.swing_freq_drift_tolerance:
+          print(f"swing frequency drifted to {window_freq:.03} Hz, using window estimate")
+          swing_freq = window_freq
+      swing_freq = swing_freq if swing_freq is not None else self.swing_freq_estimate
+
+    min_lag, max_lag = lag_band(np.ceil(1/swing_freq * self.sample_rate), self.allow_negative_lag)
+
+    if self.decimate > 1:
+      search = xcorr_coarse_to_fine(render_env, mic_env, min_lag, max_lag, self.decimate, planner=self.fft_planner)
+      lag = search.lag
+      max_corr = search.peak
+    elif self.corr_mode == "bounded":
+      corr, lags = xcorr_unbiased_bounded(render_env, mic_env, min_lag, max_lag, planner=self.fft_planner)
+      i_max_corr, max_corr, _ = _pick_lag(corr, lags[0], min_lag, max_lag, x=render_env, y=mic_env)
+      lag = lags[i_max_corr]
+    else:
+      corr, lags = xcorr_unbiased(render_env, mic_env, planner=self.fft_planner)
+      i_max_corr, max_corr, _ = _pick_lag(corr, lags[0], min_lag, max_lag, corr_max=np.max(corr))
+      lag = lags[i_max_corr]
+
+    return SimpleNamespace(
+      start = start,
+      stop = stop,
+      swing_freq = swing_freq,
+      lag = lag / self.sample_rate,
+      max_corr = max_corr
+    )
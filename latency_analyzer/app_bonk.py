@@ -12,14 +12,16 @@ import numpy as np
 import tkinter as tk
 from tkinter import filedialog
 
-from .analysis import BonkAnalysis
+from .analysis import BonkAnalysis, vline_segments
+from .cache import DiskCache
+from .lod import plot_lod
 
 class FilePlots:
   def __init__(self, ax, analysis, colors=()):
     self.ax = ax
     self.analysis = analysis
     self.colors = colors
-    self.time = np.linspace(0.0, self.analysis.duration, self.analysis.num_samples)
+    # waves are drawn at the resolution of the view, so no time axis is kept; sample i is at i*sample_duration
     self.channels = [self._plot_channel(i) for i in range(len(self.analysis.channels))]
     abs_max = self.analysis.abs_max_amplitude
     self.selected_rect = patches.Rectangle((0, -abs_max), 0.0, 2*abs_max, linewidth=0, facecolor="#000", alpha=0.25)
@@ -32,49 +34,22 @@ class FilePlots:
     channel_analysis = self.analysis.channels[i]
     return SimpleNamespace(
       onsets = self.ax.vlines(channel_analysis.onsets, -abs_max, abs_max, label=f"onsets {channel_num}", color=color, alpha=1, linestyle="--"),
-      wave = self.ax.plot(self.time, channel_analysis.audio, label=f"wave {channel_num}", color=color, alpha=0.75)[0]
+      wave = plot_lod(self.ax, channel_analysis.audio, dx=self.analysis.sample_duration, label=f"wave {channel_num}", color=color, alpha=0.75)
     )
 
   def update_trim(self, start, end):
     start_time = start*self.analysis.sample_duration
     end_time = end*self.analysis.sample_duration
     
-    for channel_analysis, channel_plots in zip(self.analysis.channels, self.channels):
-      self._update_vlines(channel_plots.onsets, self._trim_data(channel_analysis.onsets, start_time, end_time))
-      channel_plots.wave.set_data(self.time[start:end+1], channel_analysis.audio[start:end+1])
-    self.ax.set_xlim(self.time[start], self.time[end])
+    abs_max = self.analysis.abs_max_amplitude
+    for channel_num, channel_analysis, channel_plots in zip(self.analysis.channel_indices, self.analysis.channels, self.channels):
+      channel_plots.onsets.set_segments(vline_segments(self.analysis.onset_index.between(start_time, end_time, channel_num), -abs_max, abs_max))
+      channel_plots.wave.set_range(start, end+1)
+    self.ax.set_xlim(start_time, end_time)
 
   def update_selected_onsets(self, start_time, duration):
     self.selected_rect.set(x=start_time, width=duration)
     
-  @staticmethod
-  def _update_vlines(h, x, ymin=None, ymax=None):
-    seg_old = h.get_segments()
-    if ymin is None:
-      ymin = seg_old[0][0, 1]
-    if ymax is None:
-      ymax = seg_old[0][1, 1]
-    
-    seg_new = [np.array([[xx, ymin],
-                         [xx, ymax]]) for xx in x]
-  
-    h.set_segments(seg_new)
-
-  @staticmethod
-  def _trim_data(data, start_time, end_time):
-    last_i = len(data) - 1
-    start_i = 0
-    end_i = last_i
-    for i, time in enumerate(data):
-      if time >= start_time:
-        start_i = i
-        break
-    for i, time in enumerate(data[::-1]):
-      if time <= end_time:
-        end_i = last_i - i
-        break
-    return data[start_i:end_i+1]
-
 class App:
   def __init__(self, root, options):
     self.root = root
@@ -83,6 +58,7 @@ class App:
     
     self.analysis = None
     self.time = None
+    self.cache = DiskCache(self.options.cache_dir, max_bytes=int(self.options.cache_max_size * 2**20)) if self.options.cache_dir is not None else None
     self.fig = matplotlib.figure.Figure((5, 4))
     self.ax = self.fig.add_subplot()
 
@@ -168,8 +144,17 @@ class App:
         "hop_length": self.options.onsets_hop_length,
         "backtrack": True
       },
-      channels=self.options.analysis_channels
+      coarse_hop_length=self.options.onsets_coarse_hop_length,
+      channels=self.options.analysis_channels,
+      pair_tolerance=self.options.pair_tolerance,
+      cache=self.cache,
+      cache_source=self.cache.file_identity(path) if self.cache is not None else None
     )
+    for pairs in self.analysis.pairs:
+      stats = pairs.stats
+      print(f"channel {self.analysis.reference_channel} -> {pairs.channel}: {stats.count} pairs ({pairs.unpaired_reference} + {pairs.unpaired} unpaired onsets)")
+      if stats.count > 0:
+        print(f"  latency median {stats.median*1000:.3f} ms, mean {stats.mean*1000:.3f} ms, stdev {stats.stdev*1000:.3f} ms, 5-95% {stats.p5*1000:.3f}-{stats.p95*1000:.3f} ms")
     self.ax.clear()
     self.plots = FilePlots(self.ax, self.analysis, self.options.analysis_channel_colors)
 
@@ -212,15 +197,11 @@ class App:
     if t is None or self.analysis is None:
       return
 
-    onset0 = None
-    for i, onset_time in enumerate(self.analysis.onsets):
-      if t < onset_time:
-        break
-      onset0 = i
+    onset0 = self.analysis.onset_index.at(t)
 
     onset1 = 0
     if onset0 is not None:
-      onset1 = onset0 + 1 if onset0 < len(self.analysis.onsets)-1 else None
+      onset1 = onset0 + 1 if onset0 < len(self.analysis.onset_index)-1 else None
 
     self.selected_onsets = self._alter_selected_onsets(self.selected_onsets, (onset0, onset1), combine=self.shift_down)
     self._update_selected_onsets()
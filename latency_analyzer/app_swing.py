@@ -1,8 +1,7 @@
-import csv
 import os
-import re
+import queue
 import subprocess
-import sys
+import threading
 from types import SimpleNamespace
 
 import librosa
@@ -18,33 +17,24 @@ import numpy as np
 import tkinter as tk
 from tkinter import filedialog, ttk
 
-from .analysis import SwingAnalysis, truncate_to_even
-
-def log(value="", indent=0, *args, **kwargs):
-  print(f"{'  '*indent}{value}", file=sys.stderr, *args, **kwargs)
-
-def format_quantity(value, unit):
-  suffix = f" {unit}" if unit else ""
-  return f"{value}{suffix}"
-
-def format_label(name, unit):
-  suffix = f" ({unit})" if unit else ""
-  return f"{name}{suffix}"
+from .analysis import FFTPlanner, group_by, results_table, truncate_to_even
+from .batch import add_to_bins, analysis_lag_stats, bin_tasks, draw_bins_boxplot, format_label, format_quantity, group_files, initial_bin_stats, iter_analyze_tasks, list_files, log, make_re_bin_func, open_cache, outlier_order, save_outputs, windows_boxplot_data
+from .cache import LRUCache
+from .lod import plot_lod
+from .stats import lag_stats_by, merge_lag_stats
 
 def reveal_file(path):
   # TODO: escape properly, this will break on paths with quotes
   subprocess.check_call(f'explorer.exe /select,"{path}"')
 
 class FilePlots:
-  def __init__(self, ax0, ax1, ax2, analysis, colors=(), plot_win=0):
+  def __init__(self, ax0, ax1, ax2, analysis, selected_result, colors=()):
     self.ax0 = ax0
     self.ax1 = ax1
     self.ax2 = ax2
     self.analysis = analysis
-    self.selected_result = self.analysis.results[plot_win]
+    self.selected_result = selected_result
     self.colors = colors
-    self.time = np.linspace(0.0, self.analysis.win_len_s, self.analysis.win_len)
-    self.time = self.time[:len(self.time)-2*self.analysis.env_trim]
     
     self.mic_color = self.colors[0] if 0 < len(self.colors) else "k"
     self.render_color = self.colors[1] if 1 < len(self.colors) else "k"
@@ -53,26 +43,30 @@ class FilePlots:
       self.selected_result.mic_sig, sr=self.analysis.sample_rate,
       label="mic", color=self.mic_color, alpha=0.25, ax=self.ax0
     )
-    self.mic_env_plot = self.ax0.plot(
-      self.time, self.selected_result.mic_env,
+    # envelopes and correlations are drawn at the resolution of the view (see lod.py)
+    self.mic_env_plot = plot_lod(
+      self.ax0, self.selected_result.mic_env, dx=self.analysis.sample_duration,
       label=f"mic envelope", color="k", alpha=1, linewidth=0.5
-    )[0]
+    )
 
     self.render_sig_plot = librosa.display.waveshow(
       self.selected_result.render_sig, sr=self.analysis.sample_rate,
       label="render", color=self.render_color, alpha=0.25, ax=self.ax1
     )
-    self.render_env_plot = self.ax1.plot(
-      self.time, self.selected_result.render_env,
+    self.render_env_plot = plot_lod(
+      self.ax1, self.selected_result.render_env, dx=self.analysis.sample_duration,
       label=f"render envelope", color="k", alpha=1, linewidth=0.5
-    )[0]
+    )
 
-    self.corr_raw_plot = self.ax2.plot(
-      self.selected_result.corr_lags_s, self.selected_result.corr_raw,
+    # correlation lags are evenly spaced
+    lags_s = self.selected_result.corr_lags_s
+    lag_step_s = lags_s[1] - lags_s[0] if len(lags_s) > 1 else self.analysis.sample_duration
+    self.corr_raw_plot = plot_lod(
+      self.ax2, self.selected_result.corr_raw, x0=lags_s[0], dx=lag_step_s,
       color="k", alpha=0.25, linewidth=0.5
     )
-    self.corr_plot = self.ax2.plot(
-      self.selected_result.corr_lags_s, self.selected_result.corr,
+    self.corr_plot = plot_lod(
+      self.ax2, self.selected_result.corr, x0=lags_s[0], dx=lag_step_s,
       color="k", alpha=1, linewidth=0.5
     )
     # self.corr_max_plot = self.ax2.plot([self.selected_result.lag], [self.selected_result.max_corr], "o", color="r", markersize=2)
@@ -82,11 +76,11 @@ class FilePlots:
     start_time = start*self.analysis.sample_duration
     end_time = end*self.analysis.sample_duration
 
-    self.mic_env_plot.set_data(self.time[start:end+1], self.selected_result.mic_env[start:end+1])
-    self.render_env_plot.set_data(self.time[start:end+1], self.selected_result.render_env[start:end+1])
+    self.mic_env_plot.set_range(start, end+1)
+    self.render_env_plot.set_range(start, end+1)
     
     for ax in (self.ax0, self.ax1):
-      ax.set_xlim(self.time[start], self.time[end])
+      ax.set_xlim(start_time, end_time)
     
     # for channel_analysis, channel_plots in zip(self.analysis.channels, self.channels):
     #   channel_plots.wave.set_data(self.time[start:end+1], channel_analysis.audio[start:end+1])
@@ -94,13 +88,15 @@ class FilePlots:
     pass
 
 class EnvsPlot:
-  def __init__(self, frame, options, bins, result_info):
+  def __init__(self, frame, options, bins, result_info, signals_cache):
     self.frame = frame
     self.options = options
     self.bins = bins
 
     self.bin_key, self.file_i, self.result_i = result_info
     self.analysis = self.bins[self.bin_key][self.file_i]
+    # results only hold scalars, so the window's signals are rebuilt on demand
+    self.selected_result = signals_cache.get(result_info, lambda: self.analysis.window_signals(self.result_i))
     self.time = None
     self.fig = matplotlib.figure.Figure((self.options.plot_width, self.options.plot_height))
     self.gs = gridspec.GridSpec(2, 1, height_ratios=[2,1], wspace=0.0)
@@ -165,7 +161,7 @@ class EnvsPlot:
       label="end trim (samples)"
     )
 
-    self.plots = FilePlots(self.ax0, self.ax1, self.ax2, self.analysis, self.options.analysis_channel_colors, self.result_i)
+    self.plots = FilePlots(self.ax0, self.ax1, self.ax2, self.analysis, self.selected_result, self.options.analysis_channel_colors)
 
     self.ax0.set_title(f"{self.analysis.filename} ({self.analysis.sample_rate} Hz)", fontsize=self.options.font_size)
     self.ax0.legend(loc="upper right", fontsize=self.options.font_size)
@@ -186,11 +182,9 @@ class EnvsPlot:
     self.start_trim_widget.configure(to=max(0, win_len_trimmed-1))
     self.end_trim_widget.configure(to=max(0, win_len_trimmed-1))
 
-    start_frame = int(self.options.start * self.analysis.sample_rate)
-    end_frame = start_frame + int(self.options.length * self.analysis.sample_rate) if self.options.length is not None else self.analysis.num_samples-1
-
-    self.start_trim_var.set(start_frame)
-    self.end_trim_var.set(end_frame)
+    # --start and --length already limit the analysed range, so show the whole window
+    self.start_trim_var.set(0)
+    self.end_trim_var.set(max(0, win_len_trimmed-1))
     self._update_trim(draw=False)
     
     # pack widgets
@@ -235,59 +229,26 @@ class BinsBoxPlot:
 
     self.fig = matplotlib.figure.Figure((self.options.plot_width, self.options.plot_height))
     self.ax = self.fig.add_subplot()
-    self.x = np.array(sorted(bins.keys()))
-    self.bins = [np.array(bins[k], dtype=np.float32) for k in self.x]
 
-    items = [self.ax.title, self.ax.xaxis.label, self.ax.yaxis.label] + self.ax.get_xticklabels() + self.ax.get_yticklabels()
-    for item in items:
-      item.set_fontsize(self.options.font_size)
+    self.actions_frame = tk.Frame(self.frame)
+    self.debug_button = tk.Button(self.actions_frame, text="Debug", command=self._on_debug)
+    self.debug_button.pack(side=tk.RIGHT)
+    self.actions_frame.pack(side=tk.TOP, fill=tk.X)
     
-    self.means_binned = np.array([np.mean(values) for values in self.bins], dtype=np.float32)
-    self.stdevs_binned = np.array([np.std(values) for values in self.bins], dtype=np.float32)
-
-    if self.frame is not None:
-      self.actions_frame = tk.Frame(self.frame)
-      self.debug_button = tk.Button(self.actions_frame, text="Debug", command=self._on_debug)
-      self.debug_button.pack(side=tk.RIGHT)
-      self.actions_frame.pack(side=tk.TOP, fill=tk.X)
-      
-      self.canvas = FigureCanvasTkAgg(self.fig, master=self.frame)
-      self.canvas.draw() # TODO: refactor?
-      
-      self.toolbar = NavigationToolbar2Tk(self.canvas, self.frame, pack_toolbar=False)
-      self.toolbar.update()
-      
-      self.toolbar.pack(side=tk.BOTTOM, fill=tk.X)
-      self.canvas.get_tk_widget().pack(side=tk.TOP, fill=tk.BOTH, expand=1)
+    self.canvas = FigureCanvasTkAgg(self.fig, master=self.frame)
+    self.canvas.draw() # TODO: refactor?
     
-    width = (np.min(np.ediff1d(self.x)) if len(self.x) > 1 else 1) * 0.75
-    self.ax.set_title(title, fontsize=self.options.font_size)
-    self.ax.grid(axis="y", alpha=0.5)
-    self.ax.boxplot(self.bins, positions=self.x, widths=width, showmeans=self.options.box_plot_means)
-
-    if self.options.ytick_base is not None:
-      self.ax.yaxis.set_major_locator(plticker.MultipleLocator(base=self.options.ytick_base))
+    self.toolbar = NavigationToolbar2Tk(self.canvas, self.frame, pack_toolbar=False)
+    self.toolbar.update()
     
-    # self.ax.plot(
-    #   self.x, self.means_binned,
-    #   label=f"mean lag", color="k", alpha=1, linewidth=0.5
-    # )
-
-    self.ax.set_xlabel(xlabel)
-    # self.ax.set_xticks([i+1 for i, _ in enumerate(self.x)], self.x)
-    self.ax.set_ylabel(ylabel)
+    self.toolbar.pack(side=tk.BOTTOM, fill=tk.X)
+    self.canvas.get_tk_widget().pack(side=tk.TOP, fill=tk.BOTH, expand=1)
 
-    data_min = np.min(np.concatenate(self.bins))
-    data_max = np.max(np.concatenate(self.bins))
-    if self.options.ymin is not None and self.options.ymin < data_min:
-      self.ax.set_ylim(bottom=self.options.ymin)
-    if self.options.ymax is not None and self.options.ymax > data_max:
-      self.ax.set_ylim(top=self.options.ymax)
+    draw_bins_boxplot(self.ax, bins, self.options, title, xlabel, ylabel)
     
     mplcursors.cursor(self.ax, hover=mplcursors.HoverMode.Transient)
     
-    if self.frame is not None:
-      self.fig.canvas.draw_idle()
+    self.fig.canvas.draw_idle()
 
   def _on_debug(self):
     import pdb; pdb.set_trace()
@@ -300,8 +261,8 @@ class WindowsPlot:
 
     self.fig = matplotlib.figure.Figure((self.options.plot_width, self.options.plot_height))
     self.ax = self.fig.add_subplot()
-    self.x = np.array(list(range(len(self.analysis.results))))
-    self.y = np.array([r.lag * 1000 for r in analysis.results])
+    self.x = np.arange(len(self.analysis.results))
+    self.y = self.analysis.results["lag"] * 1000
 
     items = [self.ax.title, self.ax.xaxis.label, self.ax.yaxis.label] + self.ax.get_xticklabels() + self.ax.get_yticklabels()
     for item in items:
@@ -338,17 +299,39 @@ class WindowsPlot:
     self.fig.canvas.draw_idle()
     
 class PlotWindow:
+  # how often the main thread looks for finished analyses
+  poll_interval_ms = 100
+
   def __init__(self, root, options, bin_func):
     self.root = root
     self.root.title(f"analyze-swing")
     self.options = options
     self.bin_func = bin_func
-    self.name_filter_re = re.compile(self.options.name_filter_re) if self.options.name_filter_re is not None else None
     self.selectable_results = []
+    # the key of the plot shown: ("bins",), ("bin windows", bin key), ("file windows", bin key, file index)
+    # or ("window", bin key, file index, window index)
     self.selected_result = None
-    self.headless = self.options.headless
+    # {tree item id: key}, and the ids of the nodes whose children haven't been created yet
+    self.result_keys = {}
+    self.unloaded_results = set()
+    # (row indices, differences from median), from outlier_order once needed
+    self.outliers = None
+    self.outlier_i = -1
+
+    # analysis runs in a background thread, which sends (run id, message kind, *args) here
+    self.analysis_queue = queue.Queue()
+    self.analysis_run_id = 0
+    self.analysis_cancel = None
+    self.analysis_progress = None
+    # the pending root.after call of _poll_analysis_queue, so there's only ever one
+    self.analysis_poll_id = None
 
     self.bins = {}
+    self.results = results_table(self.bins)
+    self.bin_stats = {}
+    self.signals_cache = LRUCache(self.options.signals_cache_size)
+    self.fft_planner = FFTPlanner(workers=self.options.fft_workers)
+    self.cache = open_cache(self.options)
 
     self.canvas_frame = tk.Frame(self.root)
     self.plot = None
@@ -356,246 +339,307 @@ class PlotWindow:
     self.selected_result_frame = tk.Frame(self.root)    
     self.selected_result_frame.pack(side=tk.LEFT, fill=tk.Y) 
     # self.selected_result_frame.pack_propagate(0)
+
+    self.progress_frame = tk.Frame(self.selected_result_frame)
+    self.progress_frame.pack(side=tk.TOP, fill=tk.X)
+    self.cancel_button = tk.Button(self.progress_frame, text="Cancel", command=self._on_cancel, state=tk.DISABLED)
+    self.cancel_button.pack(side=tk.RIGHT)
+    self.progress_var = tk.StringVar()
+    self.progress_label = tk.Label(self.progress_frame, textvariable=self.progress_var, anchor=tk.W)
+    self.progress_label.pack(side=tk.TOP, fill=tk.X)
+    self.progress_bar = ttk.Progressbar(self.progress_frame, mode="determinate")
+    self.progress_bar.pack(side=tk.TOP, fill=tk.X, expand=1)
+
+    self.outlier_frame = tk.Frame(self.selected_result_frame)
+    self.outlier_frame.pack(side=tk.TOP, fill=tk.X)
+    tk.Button(self.outlier_frame, text="Next outlier", command=lambda: self._on_outlier(1)).pack(side=tk.RIGHT)
+    tk.Button(self.outlier_frame, text="Previous outlier", command=lambda: self._on_outlier(-1)).pack(side=tk.RIGHT)
+    self.outlier_var = tk.StringVar()
+    tk.Label(self.outlier_frame, textvariable=self.outlier_var, anchor=tk.W).pack(side=tk.LEFT, fill=tk.X)
    
-    self.selected_result_list = tk.Listbox(
+    self.result_tree = ttk.Treeview(
       self.selected_result_frame,
-      width=50,
-      selectmode=tk.SINGLE,
-      activestyle=tk.NONE
+      columns=("latency",),
+      selectmode=tk.BROWSE
     )
-    self.selected_result_list.pack(side=tk.LEFT, fill=tk.BOTH, expand=1)
-    self.selected_result_list.bind('<<ListboxSelect>>', self._on_selected_result_change)
+    self.result_tree.heading("#0", text="result")
+    self.result_tree.heading("latency", text="latency (ms)")
+    self.result_tree.column("#0", width=300)
+    self.result_tree.column("latency", width=90, anchor=tk.E)
+    self.result_tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=1)
+    self.result_tree.bind('<<TreeviewSelect>>', self._on_selected_result_change)
+    self.result_tree.bind('<<TreeviewOpen>>', self._on_result_open)
 
     self.selected_result_scrollbar = tk.Scrollbar(self.selected_result_frame)
     self.selected_result_scrollbar.pack(side=tk.RIGHT, fill=tk.BOTH)
 
-    self.selected_result_list.config(yscrollcommand=self.selected_result_scrollbar.set)
-    self.selected_result_scrollbar.config(command=self.selected_result_list.yview)
+    self.result_tree.config(yscrollcommand=self.selected_result_scrollbar.set)
+    self.selected_result_scrollbar.config(command=self.result_tree.yview)
     
     self.canvas_frame.pack(side=tk.RIGHT, fill=tk.BOTH, expand=1)
 
+  @property
+  def results(self):
+    # rows of the analyses that arrived since the table was last read are joined on when it's needed,
+    # rather than the whole table being rebuilt for each one
+    if self.new_results:
+      self._results = np.concatenate(([self._results] if len(self._results) > 0 else []) + self.new_results)
+      self.new_results = []
+    return self._results
+
+  @results.setter
+  def results(self, results):
+    self._results = results
+    self.new_results = []
+    # outliers are row numbers into the table, so they don't carry over to another one
+    self.outliers = None
+    self.outlier_i = -1
+
   def open_path(self, path):
-    log(f"open path: {path}")
-    if os.path.isdir(path):
-      files = [os.path.join(path, fn) for fn in os.listdir(path)]
-    else:
-      files = [path]
-    self.open_files(files)
-    
-  def open_files(self, files):
-    log("group files")
-    
-    groups = {}
-    for file_path in files:
-      fn = os.path.basename(file_path)
-      base, ext = os.path.splitext(fn)
-      ext = ext.lower()
-      if ext != ".wav":
+    # returns right away; analyses show up in the list as they finish (see _poll_analysis_queue).
+    # a run that's still going is cancelled, and anything it still sends is ignored
+    if self.analysis_cancel is not None:
+      self.analysis_cancel.set()
+    if self.analysis_poll_id is not None:
+      self.root.after_cancel(self.analysis_poll_id)
+    self.analysis_run_id += 1
+    self.analysis_cancel = threading.Event()
+    self.analysis_progress = SimpleNamespace(done=0, total=None)
+
+    self.bins = {}
+    self.results = results_table(self.bins)
+    # {bin key: LagStats}, accumulated as analyses arrive
+    self.bin_stats = initial_bin_stats(self.options)
+    self.signals_cache = LRUCache(self.options.signals_cache_size)
+    self.selected_result = None
+    self.result_tree.delete(*self.result_tree.get_children())
+    self.result_keys = {}
+    self.unloaded_results = set()
+    self.outlier_var.set("")
+    for widget in self.canvas_frame.winfo_children():
+      widget.destroy()
+
+    self.progress_var.set(f"open {os.path.basename(path)}")
+    self.progress_bar.configure(mode="indeterminate")
+    self.progress_bar.start()
+    self.cancel_button.configure(state=tk.NORMAL)
+
+    threading.Thread(
+      target=self._analyze_in_background,
+      args=(self.analysis_run_id, path, self.analysis_cancel),
+      daemon=True
+    ).start()
+    self.analysis_poll_id = self.root.after(self.poll_interval_ms, self._poll_analysis_queue)
+
+  def _analyze_in_background(self, run_id, path, cancel):
+    # only touches the queue; the bins and all widgets belong to the main thread
+    def send(*message):
+      self.analysis_queue.put((run_id,) + message)
+
+    try:
+      tasks = bin_tasks(group_files(list_files(path), self.options), self.bin_func)
+      send("start", len(tasks))
+      for bin_key, analysis in iter_analyze_tasks(tasks, self.options, self.fft_planner, self.cache, cancel):
+        send("analysis", bin_key, analysis)
+      send("done", cancel.is_set())
+    except Exception as e:
+      log(f"analysis failed: {e!r}")
+      send("error", e)
+
+  def _poll_analysis_queue(self):
+    self.analysis_poll_id = None
+    added = False
+    finished = None
+    while True:
+      try:
+        run_id, kind, *args = self.analysis_queue.get_nowait()
+      except queue.Empty:
+        break
+      if run_id != self.analysis_run_id:
         continue
-      if self.name_filter_re is not None:
-        m = self.name_filter_re.search(fn)
-        if not m:
-          continue
-
-        group = m.groups()
-        if not group:
-          group = (fn,)
-
-        if group not in groups:
-          groups[group] = []
-        groups[group].append(file_path)
-
-    if not groups:
-      raise FileNotFoundError("no matching files found")
-        
-    mic_file_i, mic_channel_i = self.options.mic_channel
-    render_file_i, render_channel_i = self.options.render_channel
-    
-    for group_key, group_files in groups.items():
-      log(f"{group_key}", indent=1)
-      group_files.sort(key=lambda s: s.lower())
-      for i, path in enumerate(group_files):
-        fn = os.path.basename(path)
-        log(f"[{i}] {fn}", indent=2)
-        
-        if i == mic_file_i:
-          log(f"[{mic_channel_i}] mic channel", indent=3)
-
-        if i == render_file_i:
-          log(f"[{render_channel_i}] render channel", indent=3)
-
-    log()
-
-    log("analyze")
-    bins = {}
-    for group_key, group_files in groups.items():    
-      log(group_key, indent=1)
-      if self.bin_func is not None:
-        try:
-          bin_key = self.bin_func(group_key[0]) # TODO: kinda arbitrary choice...
-        except ValueError as e:
-          log(f"failed to parse bin key: {e}", indent=2)
-          continue
-        else:
-          log(f"bin key: {bin_key}", indent=2)
-      else:
-        bin_key = 0
-        log(f"bin key: {bin_key} (default)", indent=2)
 
-      # read only the necessary files, and only once
-      
-      file_signals = {}
-      for file_i in (mic_file_i, render_file_i):
-        if file_i not in file_signals:
-          file_signals[file_i] = librosa.load(group_files[file_i], sr=None, mono=False)
-
-      # extract mic and render channels
-          
-      mic_sig, mic_sample_rate = file_signals[mic_file_i]
-      if len(mic_sig.shape) == 1:
-        mic_sig = mic_sig.reshape((1,-1))
-      mic_sig = mic_sig[mic_channel_i, :]
-
-      render_sig, render_sample_rate = file_signals[render_file_i]
-      if len(render_sig.shape) == 1:
-        render_sig = render_sig.reshape((1,-1))
-      render_sig = render_sig[render_channel_i, :]
-
-      assert mic_sample_rate == render_sample_rate
-
-      mic_len = mic_sig.shape[0]
-      render_len = render_sig.shape[0]
-      log(f"mic signal length: {mic_len}", indent=1)
-      log(f"render signal length: {mic_len}", indent=1)
-
-      if mic_len != render_len:
-        shorter_len = min(mic_len, render_len)
-        log(f"truncate to {shorter_len}")
-        mic_sig = mic_sig[:shorter_len]
-        render_sig = render_sig[:shorter_len]
-      
-      assert mic_sig.shape == render_sig.shape
+      if kind == "start":
+        self.analysis_progress.total = args[0]
+        self.progress_bar.stop()
+        self.progress_bar.configure(mode="determinate", maximum=max(args[0], 1), value=0)
+      elif kind == "analysis":
+        add_to_bins(self.bins, *args)
+        bin_key, analysis = args
+        rows = results_table({bin_key: [analysis]})
+        rows["file"] = len(self.bins[bin_key]) - 1
+        self.new_results.append(rows)
+        merge_lag_stats(self.bin_stats, {bin_key: analysis_lag_stats(analysis)})
+        self.analysis_progress.done += 1
+        added = True
+      else:
+        finished = (kind, args[0])
 
-      sample_rate = mic_sample_rate
-      
-      analysis = SwingAnalysis(
-        mic_sig,
-        render_sig,
-        sample_rate,
-        self.options.rms_win_len,
-        win_len=self.options.win_len,
-        mic_env_method=self.options.mic_env_method,
-        render_env_method=self.options.render_env_method,
-        mic_env_invert=self.options.mic_env_invert,
-        render_env_invert=self.options.render_env_invert,
-        env_trim=self.options.env_trim,
-        swing_freq=self.options.swing_freq,
-        allow_negative_lag=self.options.allow_negative_lag,
-        path=group_files[0]
-      )
-      
-      if bin_key not in bins:
-        bins[bin_key] = []
-      bins[bin_key].append(analysis)
+    if added:
+      self.outliers = None
+      self._update_result_tree()
+      self.progress_bar.configure(value=self.analysis_progress.done)
+      self.progress_var.set(f"analyzed {self.analysis_progress.done} of {self.analysis_progress.total} groups")
 
-    self.bins = bins
+    if finished is None:
+      self.analysis_poll_id = self.root.after(self.poll_interval_ms, self._poll_analysis_queue)
+    else:
+      self._finish_analysis(*finished)
+
+  def _finish_analysis(self, kind, arg):
+    self.progress_bar.stop()
+    self.cancel_button.configure(state=tk.DISABLED)
+    progress = self.analysis_progress
+    if kind == "error":
+      self.progress_bar.configure(mode="determinate", value=0)
+      self.progress_var.set(f"error: {arg}")
+      return
+    if arg:
+      self.progress_var.set(f"cancelled after {progress.done} of {progress.total} groups")
+      return
 
-    if self.options.save_lags_csv is not None:
-      self._save_csv(self.options.save_lags_csv)
-    
-    self._populate_selected_result_list()
-
-  def _save_csv(self, csv_path):
-    with open(csv_path, "w", newline="") as csvfile:
-      fieldnames = ["bin", "file", "window", "lag_ms"]
-      writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-      writer.writeheader()
-      for bin_key, analyses in self.bins.items():
-        for analysis_i, analysis in enumerate(analyses):
-          for result_i, result in enumerate(analysis.results):
-            writer.writerow({
-              "bin": bin_key,
-              "file": analysis_i,
-              "window": result_i,
-              "lag_ms": result.lag * 1000
-            })
-    
-  def _populate_selected_result_list(self):
-    self.selected_result_list.delete(0, tk.END)
-    self.plot_functions = []
+    self.progress_var.set(f"analyzed {progress.done} groups")
+    self.results = save_outputs(self.bins, self.options, self.bin_stats)
+    self.outlier_var.set("")
+    # plots of whole bins were drawn from partial results
+    if self.selected_result is None or self.selected_result[0] in ("bins", "bin windows"):
+      self._select_plot(self.selected_result or ("bins",), force=True)
+
+  def _on_cancel(self):
+    if self.analysis_cancel is not None:
+      self.analysis_cancel.set()
+      self.progress_var.set("cancelling after the current group...")
+      self.cancel_button.configure(state=tk.DISABLED)
+
+  def _result_iid(self, key):
+    # tree item ids are the keys as strings, so keys from the bins and from the results table agree
+    return "/".join(str(part) for part in key)
+
+  def _insert_result_node(self, parent, index, key, text, latency="", lazy=False):
+    iid = self._result_iid(key)
+    self.result_keys[iid] = key
+    self.result_tree.insert(parent, index, iid=iid, text=text, values=(latency,))
+    if lazy:
+      # a placeholder child, so the node can be expanded before its children exist
+      self.result_tree.insert(iid, tk.END, iid=iid + "/...", text="...")
+      self.unloaded_results.add(iid)
+    return iid
+
+  def _insert_file_node(self, bin_key, file_i):
+    analysis = self.bins[bin_key][file_i]
+    lags = analysis.results["lag"]
+    self._insert_result_node(
+      self._result_iid(("bin windows", bin_key)), tk.END,
+      ("file windows", bin_key, file_i),
+      f"file {file_i}, {len(lags)} windows",
+      latency=f"{np.median(lags)*1000:.02f}" if len(lags) > 0 else "",
+      lazy=len(lags) > 0
+    )
 
-    bins_boxplot_func = self._make_bins_boxplot_func()
+  def _load_result_children(self, iid):
+    # create the children of a node when it's first expanded
+    if iid not in self.unloaded_results:
+      return
+    self.unloaded_results.discard(iid)
+    self.result_tree.delete(iid + "/...")
+    key = self.result_keys[iid]
+    if key[0] == "bin windows":
+      for file_i in range(len(self.bins[key[1]])):
+        self._insert_file_node(key[1], file_i)
+    elif key[0] == "file windows":
+      _, bin_key, file_i = key
+      for result_i, lag in enumerate(self.bins[bin_key][file_i].results["lag"].tolist()):
+        self._insert_result_node(iid, tk.END, ("window", bin_key, file_i, result_i), f"window {result_i}", latency=f"{lag*1000:.02f}")
+
+  def _update_result_tree(self):
+    # add nodes for the bins and files analyzed since the last update; nothing is removed,
+    # so expanded nodes and the selection stay as they are
+    if not self.bins:
+      return
+    if not self.result_tree.exists(self._result_iid(("bins",))):
+      self._insert_result_node("", 0, ("bins",), f"latency by {self.options.bin_name}")
+
+    for bin_i, bin_key in enumerate(sorted(self.bins.keys())):
+      bin_iid = self._result_iid(("bin windows", bin_key))
+      text = f"{self.options.bin_name} {format_quantity(bin_key, self.options.bin_unit)}, {len(self.bins[bin_key])} files"
+      if not self.result_tree.exists(bin_iid):
+        self._insert_result_node("", bin_i + 1, ("bin windows", bin_key), text, lazy=True)
+        continue
+      self.result_tree.item(bin_iid, text=text)
+      if bin_iid not in self.unloaded_results:
+        for file_i in range(len(self.result_tree.get_children(bin_iid)), len(self.bins[bin_key])):
+          self._insert_file_node(bin_key, file_i)
 
-    if self.options.save_bins_boxplot is not None:
-      bins_boxplot_func().fig.savefig(self.options.save_bins_boxplot)
+    if self.selected_result is None:
+      # the first results are in
+      self._select_plot(("bins",))
 
-    self._add_selectable_plot(
-      f"latency by {self.options.bin_name}",
-      bins_boxplot_func
-    )
+  def _on_result_open(self, event):
+    self._load_result_children(self.result_tree.focus())
 
-    # self._add_selectable_plot(
-    #   f"difference from {self.options.bin_name} median latency by window",
-    #   self._make_median_diff_boxplot_func()
-    # )
-    
-    for key in sorted(self.bins.keys()):
-      if len(self.bins[key]) > 1:
-        windows_boxplot_func = self._make_windows_boxplot_func(key)
-        
-        if self.options.save_windows_boxplot is not None:
-          windows_boxplot_path = self.options.save_windows_boxplot
-          if len(self.bins) > 1:
-            base, ext = os.path.splitext(windows_boxplot_path)
-            windows_boxplot_path = f"{base} - {self.options.bin_name} {format_quantity(key, self.options.bin_unit)}{ext}"
-          windows_boxplot_func().fig.savefig(windows_boxplot_path)
-          
-        self._add_selectable_plot(
-          f"{self.options.bin_name} {format_quantity(key, self.options.bin_unit)} latency by window",
-          windows_boxplot_func
-        )
-      
-      for file_i, analysis in enumerate(self.bins[key]):
-        self._add_selectable_plot(
-          f"{self.options.bin_name} {format_quantity(key, self.options.bin_unit)}, file {file_i} latency by window",
-          self._make_windows_plot_func(analysis)
-        )
-        
-        for result_i, result in enumerate(analysis.results):
-          self._add_selectable_plot(
-            f"{self.options.bin_name} {format_quantity(key, self.options.bin_unit)}, file {file_i}, window {result_i} -> {result.lag*1000:.02f} ms",
-            self._make_envs_plot_func((key, file_i, result_i))
-          )
-
-    if self.headless:
-      sys.exit(0)
-          
-    self.selected_result_list.activate(0)
-    self.selected_result_list.selection_set(0)
-    self._on_selected_result_change(None)
-    
   def _on_selected_result_change(self, event):
-    i = self.selected_result_list.curselection()[0]
-    print(f"_on_selected_result_change, i={i}")
-
-    if i == self.selected_result:
+    selection = self.result_tree.selection()
+    if not selection or selection[0] not in self.result_keys:
+      return
+    print(f"_on_selected_result_change, {selection[0]}")
+    self._select_plot(self.result_keys[selection[0]])
+
+  def _reveal_result(self, key):
+    # expand the nodes above key (creating them as needed) and scroll it into view
+    iid = self._result_iid(key)
+    parents = []
+    if key[0] in ("file windows", "window"):
+      parents.append(self._result_iid(("bin windows", key[1])))
+    if key[0] == "window":
+      parents.append(self._result_iid(("file windows", key[1], key[2])))
+    for parent_iid in parents:
+      self._load_result_children(parent_iid)
+      self.result_tree.item(parent_iid, open=True)
+    self.result_tree.see(iid)
+    return iid
+
+  def _select_plot(self, key, force=False):
+    if key == self.selected_result and not force:
       return
+    iid = self._reveal_result(key)
+    self.result_tree.selection_set(iid)
+    self.result_tree.focus(iid)
     
-    self.selected_result = i
+    self.selected_result = key
     
     for widget in self.canvas_frame.winfo_children():
       widget.destroy()
 
-    self.plot = self.plot_functions[i]()
+    self.plot = self._make_plot_func(key)()
+
+  def _make_plot_func(self, key):
+    kind = key[0]
+    if kind == "bins":
+      return self._make_bins_boxplot_func()
+    if kind == "bin windows":
+      return self._make_windows_boxplot_func(key[1])
+    if kind == "file windows":
+      return self._make_windows_plot_func(self.bins[key[1]][key[2]])
+    return self._make_envs_plot_func(key[1:])
+
+  def _on_outlier(self, step):
+    # jump to the window with the next (step=1) or previous (step=-1) largest difference
+    # from its bin's median latency
+    if self.outliers is None:
+      self.outliers = outlier_order(self.results)
+      self.outlier_i = -1
+    order, diffs = self.outliers
+    if len(order) == 0:
+      return
+    self.outlier_i = min(max(self.outlier_i + step, 0), len(order) - 1)
+    row = self.results[order[self.outlier_i]]
+    bin_key = row["bin"].item()
+    self.outlier_var.set(f"outlier {self.outlier_i + 1} of {len(order)}: {diffs[self.outlier_i]*1000:+.02f} ms")
+    self._select_plot(("window", self.result_keys[self._result_iid(("bin windows", bin_key))][1], row["file"].item(), row["window"].item()))
 
-  def _add_selectable_plot(self, title, plot_function):
-    self.selected_result_list.insert(tk.END, title)
-    self.plot_functions.append(plot_function)
-      
   def _make_bins_boxplot_func(self):
-    bins = {k: np.array([r.lag * 1000 for a in analyses for r in a.results], dtype=np.float32) for k, analyses in self.bins.items()}
+    bins = self.bin_stats
     return lambda: BinsBoxPlot(
-      None if self.headless else self.canvas_frame,
+      self.canvas_frame,
       bins,
       self.options,
       title = f"latency by {self.options.bin_name}",
@@ -604,15 +648,9 @@ class PlotWindow:
     )
   
   def _make_median_diff_boxplot_func(self):
-    bins = {}
-    for k, analyses in self.bins.items():
-      bin_lags = [r.lag for a in analyses for r in a.results]
-      median = np.median(bin_lags)
-      for analysis in analyses:
-        for i, r in enumerate(analysis.results):
-          if i not in bins:
-            bins[i] = []
-          bins[i].append((r.lag - median)*1000)
+    _, bin_i = np.unique(self.results["bin"], return_inverse=True)
+    medians = np.array([np.median(lags) for lags in group_by(bin_i, self.results["lag"]).values()])
+    bins = lag_stats_by(self.results["window"], (self.results["lag"] - medians[bin_i])*1000)
     return lambda: BinsBoxPlot(
       self.canvas_frame,
       bins,
@@ -623,16 +661,10 @@ class PlotWindow:
     )
   
   def _make_windows_boxplot_func(self, bin_key):
-    analyses = self.bins[bin_key]
-    bins = {}
-    for analysis in analyses:
-      for i, r in enumerate(analysis.results):
-        if i not in bins:
-          bins[i] = []
-        bins[i].append(r.lag * 1000)
+    bins = windows_boxplot_data(self.results, bin_key)
     # import pdb; pdb.set_trace()
     return lambda: BinsBoxPlot(
-      None if self.headless else self.canvas_frame,
+      self.canvas_frame,
       bins,
       self.options,
       title = f"latency by window",
@@ -644,17 +676,8 @@ class PlotWindow:
     return lambda: WindowsPlot(self.canvas_frame, self.options, analysis)
   
   def _make_envs_plot_func(self, result_info):
-    return lambda: EnvsPlot(self.canvas_frame, self.options, self.bins, result_info)
-
-def make_re_bin_func(bin_name, pattern, convert=int):
-  regex = re.compile(pattern)
-  def _bin_func(filename_base):
-    m = regex.search(filename_base)
-    if not m:
-      raise ValueError(f"  no {bin_name} found in filename; pattern: {pattern}")
-    return convert(m.group(1))
-  return _bin_func
-    
+    return lambda: EnvsPlot(self.canvas_frame, self.options, self.bins, result_info, self.signals_cache)
+
 class App:
   def __init__(self, root, options):
     self.root = root
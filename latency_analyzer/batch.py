@@ -0,0 +1,411 @@
+import concurrent.futures
+import csv
+import functools
+import os
+import re
+import sys
+from types import SimpleNamespace
+
+import numpy as np
+
+from .analysis import FFTPlanner, SwingAnalysis, duration_to_samples, group_by, results_table
+from .cache import DiskCache
+from .export import results_columns, save_columns
+from .profiling import Profiler, format_profile_summary, profile_records, profile_summary, save_profile
+from .reader import read_channels, read_sample_rate
+from .stats import LagStats, lag_stats_by, load_lag_stats, merge_lag_stats, save_lag_stats
+
+# analysis of a directory of recordings into the lags CSV and boxplot files, without GUI modules.
+# matplotlib is only imported when a figure is saved, and then without pyplot or a GUI backend
+
+def log(value="", indent=0, *args, **kwargs):
+  print(f"{'  '*indent}{value}", file=sys.stderr, *args, **kwargs)
+
+def format_quantity(value, unit):
+  suffix = f" {unit}" if unit else ""
+  return f"{value}{suffix}"
+
+def format_label(name, unit):
+  suffix = f" ({unit})" if unit else ""
+  return f"{name}{suffix}"
+
+def make_re_bin_func(bin_name, pattern, convert=int):
+  regex = re.compile(pattern)
+  def _bin_func(filename_base):
+    m = regex.search(filename_base)
+    if not m:
+      raise ValueError(f"  no {bin_name} found in filename; pattern: {pattern}")
+    return convert(m.group(1))
+  return _bin_func
+
+def load_group_signals(group_files, options, start=None, stop=None):
+  # start and stop (samples from --start) narrow the range read further, e.g. to one window
+  mic_file_i, mic_channel_i = options.mic_channel
+  render_file_i, render_channel_i = options.render_channel
+
+  # read only the necessary channels and range of the necessary files, and each file only once
+
+  range_start, range_length = options.start, options.length
+  if start is not None or stop is not None:
+    sample_rate = read_sample_rate(group_files[mic_file_i])
+    range_start = duration_to_samples(options.start, sample_rate) + (start or 0)
+    if stop is not None:
+      range_length = stop - (start or 0)
+
+  file_channels = {}
+  for file_i, channel_i in (options.mic_channel, options.render_channel):
+    file_channels.setdefault(file_i, []).append(channel_i)
+
+  file_signals = {}
+  for file_i, channels in file_channels.items():
+    signals, sample_rate = read_channels(group_files[file_i], channels, start=range_start, length=range_length, dtype=options.dtype)
+    file_signals[file_i] = (dict(zip(channels, signals)), sample_rate)
+
+  # extract mic and render channels
+
+  mic_signals, mic_sample_rate = file_signals[mic_file_i]
+  mic_sig = mic_signals[mic_channel_i]
+
+  render_signals, render_sample_rate = file_signals[render_file_i]
+  render_sig = render_signals[render_channel_i]
+
+  assert mic_sample_rate == render_sample_rate
+
+  mic_len = mic_sig.shape[0]
+  render_len = render_sig.shape[0]
+  log(f"mic signal length: {mic_len}", indent=1)
+  log(f"render signal length: {mic_len}", indent=1)
+
+  if mic_len != render_len:
+    shorter_len = min(mic_len, render_len)
+    log(f"truncate to {shorter_len}")
+    mic_sig = mic_sig[:shorter_len]
+    render_sig = render_sig[:shorter_len]
+
+  assert mic_sig.shape == render_sig.shape
+
+  return mic_sig, render_sig, mic_sample_rate
+
+def load_group_signals_pair(group_files, options, start=None, stop=None):
+  mic_sig, render_sig, _ = load_group_signals(group_files, options, start, stop)
+  return mic_sig, render_sig
+
+def analyze_group(group_files, options, fft_planner, cache=None):
+  mic_file_i, mic_channel_i = options.mic_channel
+  render_file_i, render_channel_i = options.render_channel
+
+  # the signals are only loaded if the results aren't cached
+  cache_source = {
+    "mic": (cache.file_identity(group_files[mic_file_i]), mic_channel_i),
+    "render": (cache.file_identity(group_files[render_file_i]), render_channel_i),
+    "start": options.start,
+    "length": options.length,
+  } if cache is not None else None
+
+  return SwingAnalysis(
+    None,
+    None,
+    read_sample_rate(group_files[mic_file_i]),
+    options.rms_win_len,
+    win_len=options.win_len,
+    win_hop=options.win_hop,
+    mic_env_method=options.mic_env_method,
+    render_env_method=options.render_env_method,
+    mic_env_invert=options.mic_env_invert,
+    render_env_invert=options.render_env_invert,
+    env_trim=options.env_trim,
+    swing_freq=options.swing_freq,
+    swing_freq_decimate=options.swing_freq_decimate,
+    swing_freq_drift_tolerance=options.swing_freq_drift_tolerance,
+    allow_negative_lag=options.allow_negative_lag,
+    include_signals=options.keep_signals,
+    signals_loader=functools.partial(load_group_signals_pair, group_files, options),
+    corr_mode=options.corr_mode,
+    batch=options.batch,
+    precompute_envs=options.precompute_envs,
+    decimate=options.decimate,
+    dtype=options.dtype,
+    # the loaded signals aren't used after analysis
+    overwrite_input=True,
+    fft_planner=fft_planner,
+    cache=cache,
+    cache_source=cache_source,
+    path=group_files[0],
+    verbose=options.verbose,
+    profiler=Profiler(group_files[0], trace_memory=options.profile_memory) if options.save_profile is not None else None
+  )
+
+# analysis pool processes keep one planner, so measured correlation methods carry over between groups
+worker_fft_planner = None
+
+def _init_analysis_worker(fft_workers):
+  global worker_fft_planner
+  worker_fft_planner = FFTPlanner(workers=fft_workers)
+
+def _analyze_group_in_worker(group_files, options, cache):
+  return analyze_group(group_files, options, worker_fft_planner, cache)
+
+def list_files(path):
+  log(f"open path: {path}")
+  if os.path.isdir(path):
+    return [os.path.join(path, fn) for fn in os.listdir(path)]
+  return [path]
+
+def group_files(files, options):
+  log("group files")
+
+  name_filter_re = re.compile(options.name_filter_re) if options.name_filter_re is not None else None
+  groups = {}
+  for file_path in files:
+    fn = os.path.basename(file_path)
+    base, ext = os.path.splitext(fn)
+    ext = ext.lower()
+    if ext != ".wav":
+      continue
+    if name_filter_re is not None:
+      m = name_filter_re.search(fn)
+      if not m:
+        continue
+
+      group = m.groups()
+      if not group:
+        group = (fn,)
+
+      if group not in groups:
+        groups[group] = []
+      groups[group].append(file_path)
+
+  if not groups:
+    raise FileNotFoundError("no matching files found")
+
+  mic_file_i, mic_channel_i = options.mic_channel
+  render_file_i, render_channel_i = options.render_channel
+
+  for group_key, group_files in groups.items():
+    log(f"{group_key}", indent=1)
+    group_files.sort(key=lambda s: s.lower())
+    for i, path in enumerate(group_files):
+      fn = os.path.basename(path)
+      log(f"[{i}] {fn}", indent=2)
+
+      if i == mic_file_i:
+        log(f"[{mic_channel_i}] mic channel", indent=3)
+
+      if i == render_file_i:
+        log(f"[{render_channel_i}] render channel", indent=3)
+
+  log()
+
+  return groups
+
+def bin_tasks(groups, bin_func=None):
+  # [(bin key, group files)] for the groups whose bin key can be parsed. bin keys come first, so
+  # the groups can be analyzed in any order
+  tasks = []
+  for group_key, group_files in groups.items():
+    log(group_key, indent=1)
+    if bin_func is not None:
+      try:
+        bin_key = bin_func(group_key[0]) # TODO: kinda arbitrary choice...
+      except ValueError as e:
+        log(f"failed to parse bin key: {e}", indent=2)
+        continue
+      else:
+        log(f"bin key: {bin_key}", indent=2)
+    else:
+      bin_key = 0
+      log(f"bin key: {bin_key} (default)", indent=2)
+    tasks.append((bin_key, group_files))
+  return tasks
+
+def iter_analyze_tasks(tasks, options, fft_planner=None, cache=None, cancel=None):
+  # (bin key, SwingAnalysis) for each of bin_tasks, in task order, as soon as each is done.
+  # stops before the next task once cancel (a threading.Event) is set
+  fft_planner = fft_planner if fft_planner is not None else FFTPlanner(workers=options.fft_workers)
+  if options.jobs > 1:
+    analyses = _iter_analyze_groups_parallel([group_files for _, group_files in tasks], options, fft_planner, cache, cancel)
+    yield from zip((bin_key for bin_key, _ in tasks), analyses)
+    return
+
+  for bin_key, group_files in tasks:
+    if cancel is not None and cancel.is_set():
+      return
+    yield bin_key, analyze_group(group_files, options, fft_planner, cache)
+
+def add_to_bins(bins, bin_key, analysis):
+  if bin_key not in bins:
+    bins[bin_key] = []
+  bins[bin_key].append(analysis)
+
+def analyze_groups(groups, options, bin_func=None, fft_planner=None, cache=None):
+  # {bin key: [SwingAnalysis]}
+  log("analyze")
+  bins = {}
+  for bin_key, analysis in iter_analyze_tasks(bin_tasks(groups, bin_func), options, fft_planner, cache):
+    add_to_bins(bins, bin_key, analysis)
+  return bins
+
+def _iter_analyze_groups_parallel(groups_files, options, fft_planner, cache, cancel=None):
+  # without an explicit --fft_workers, the cores are split between the processes
+  fft_workers = options.fft_workers if options.fft_workers > 0 else max(1, (os.cpu_count() or 1) // options.jobs)
+  log(f"{len(groups_files)} groups in {options.jobs} processes", indent=1)
+  with concurrent.futures.ProcessPoolExecutor(options.jobs, initializer=_init_analysis_worker, initargs=(fft_workers,)) as executor:
+    futures = [executor.submit(_analyze_group_in_worker, group_files, options, cache) for group_files in groups_files]
+    try:
+      # in submission order, so the bins are filled exactly as in a serial run
+      for future in futures:
+        if cancel is not None and cancel.is_set():
+          return
+        analysis = future.result()
+        analysis.fft_planner = fft_planner
+        yield analysis
+    finally:
+      # on cancel (or an error), don't start the remaining groups
+      for future in futures:
+        future.cancel()
+
+def save_csv(results, csv_path):
+  with open(csv_path, "w", newline="") as csvfile:
+    fieldnames = ["bin", "file", "window", "lag_ms"]
+    writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
+    writer.writeheader()
+    columns = (results["bin"].tolist(), results["file"].tolist(), results["window"].tolist(), (results["lag"] * 1000).tolist())
+    writer.writerows(dict(zip(fieldnames, row)) for row in zip(*columns))
+
+def analysis_lag_stats(analysis):
+  # LagStats of an analysis's window latencies, in ms
+  return LagStats().add(analysis.results["lag"] * 1000)
+
+def initial_bin_stats(options):
+  # {bin key: LagStats} from the --merge_bin_stats files of earlier runs, if any
+  bin_stats = {}
+  for path in options.merge_bin_stats or []:
+    log(f"merge bin stats: {path}")
+    merge_lag_stats(bin_stats, load_lag_stats(path))
+  return bin_stats
+
+def bins_lag_stats(bins, options):
+  # {bin key: LagStats}, merged from each analysis's and from earlier runs'
+  bin_stats = initial_bin_stats(options)
+  for bin_key, analyses in bins.items():
+    merge_lag_stats(bin_stats, {bin_key: functools.reduce(LagStats.merge, map(analysis_lag_stats, analyses), LagStats())})
+  return bin_stats
+
+def windows_boxplot_data(results, bin_key):
+  results = results[results["bin"] == bin_key]
+  return lag_stats_by(results["window"], results["lag"] * 1000)
+
+def outlier_order(results):
+  # (row indices of results, their lags' difference from their bin's median lag), furthest first
+  if len(results) == 0:
+    return np.zeros(0, dtype=np.int64), np.zeros(0)
+  bin_keys, bin_i = np.unique(results["bin"], return_inverse=True)
+  medians = np.array([np.median(lags) for lags in group_by(bin_i, results["lag"]).values()])
+  diffs = results["lag"] - medians[bin_i]
+  order = np.argsort(-np.abs(diffs), kind="stable")
+  return order, diffs[order]
+
+def draw_bins_boxplot(ax, bins, options, title, xlabel, ylabel):
+  # bins: {x: LagStats}
+  import matplotlib.ticker as plticker
+
+  x = np.array(sorted(bins.keys()))
+  stats = [bins[k] for k in x]
+
+  items = [ax.title, ax.xaxis.label, ax.yaxis.label] + ax.get_xticklabels() + ax.get_yticklabels()
+  for item in items:
+    item.set_fontsize(options.font_size)
+
+  width = (np.min(np.ediff1d(x)) if len(x) > 1 else 1) * 0.75
+  ax.set_title(title, fontsize=options.font_size)
+  ax.grid(axis="y", alpha=0.5)
+  ax.bxp([s.boxplot_stats(label=str(k)) for k, s in zip(x.tolist(), stats)], positions=x, widths=width, showmeans=options.box_plot_means)
+
+  if options.ytick_base is not None:
+    ax.yaxis.set_major_locator(plticker.MultipleLocator(base=options.ytick_base))
+
+  ax.set_xlabel(xlabel)
+  ax.set_ylabel(ylabel)
+
+  data_min = min(s.min for s in stats)
+  data_max = max(s.max for s in stats)
+  if options.ymin is not None and options.ymin < data_min:
+    ax.set_ylim(bottom=options.ymin)
+  if options.ymax is not None and options.ymax > data_max:
+    ax.set_ylim(top=options.ymax)
+
+def bins_boxplot_figure(bins, options, title, xlabel, ylabel):
+  # a Figure that isn't managed by pyplot, so saving it needs no GUI backend
+  import matplotlib.figure
+
+  fig = matplotlib.figure.Figure((options.plot_width, options.plot_height))
+  draw_bins_boxplot(fig.add_subplot(), bins, options, title, xlabel, ylabel)
+  return fig
+
+def save_figures(results, bin_stats, options):
+  if options.save_bins_boxplot is not None:
+    bins_boxplot_figure(
+      bin_stats,
+      options,
+      title = f"latency by {options.bin_name}",
+      xlabel = format_label(options.bin_name, options.bin_unit),
+      ylabel = "latency (ms)"
+    ).savefig(options.save_bins_boxplot)
+
+  if options.save_windows_boxplot is not None:
+    bin_keys = np.unique(results["bin"]).tolist()
+    for key in bin_keys:
+      if len(np.unique(results["file"][results["bin"] == key])) > 1:
+        windows_boxplot_path = options.save_windows_boxplot
+        if len(bin_keys) > 1:
+          base, ext = os.path.splitext(windows_boxplot_path)
+          windows_boxplot_path = f"{base} - {options.bin_name} {format_quantity(key, options.bin_unit)}{ext}"
+        bins_boxplot_figure(
+          windows_boxplot_data(results, key),
+          options,
+          title = f"latency by window",
+          xlabel = "window",
+          ylabel = "latency (ms)"
+        ).savefig(windows_boxplot_path)
+
+def open_cache(options):
+  if options.cache_dir is None:
+    return None
+  return DiskCache(options.cache_dir, max_bytes=int(options.cache_max_size * 2**20), hash_content=options.cache_hash)
+
+def save_outputs(bins, options, bin_stats=None):
+  # save the outputs the options ask for, and return the results table. bin_stats, if already
+  # accumulated, is bins_lag_stats(bins, options)
+  results = results_table(bins)
+  if bin_stats is None:
+    bin_stats = bins_lag_stats(bins, options)
+
+  if options.save_lags_csv is not None:
+    save_csv(results, options.save_lags_csv)
+  if options.save_results is not None:
+    save_columns(options.save_results, results_columns(results, bins), append=options.save_results_append)
+  save_figures(results, bin_stats, options)
+
+  if options.save_bin_stats is not None:
+    save_lag_stats(options.save_bin_stats, bin_stats)
+
+  if options.save_profile is not None:
+    profilers = [analysis.profiler for analyses in bins.values() for analysis in analyses]
+    save_profile(options.save_profile, profilers)
+    log(format_profile_summary(profile_summary(profile_records(profilers))))
+
+  return results
+
+def analyze_path(path, options, bin_func=None, fft_planner=None, cache=None):
+  # analyze a file or directory and save the outputs the options ask for
+  if cache is None:
+    cache = open_cache(options)
+
+  groups = group_files(list_files(path), options)
+  bins = analyze_groups(groups, options, bin_func, fft_planner=fft_planner, cache=cache)
+  results = save_outputs(bins, options)
+
+  return SimpleNamespace(
+    bins = bins,
+    results = results
+  )
@@ -0,0 +1,120 @@
+from collections import OrderedDict
+import hashlib
+import json
+import os
+import tempfile
+from types import SimpleNamespace
+import zipfile
+
+import numpy as np
+
+class LRUCache:
+  def __init__(self, max_size):
+    self.max_size = max_size
+    self.items = OrderedDict()
+
+  def get(self, key, compute):
+    if key in self.items:
+      self.items.move_to_end(key)
+      return self.items[key]
+
+    value = compute()
+    if self.max_size > 0:
+      self.items[key] = value
+      while len(self.items) > self.max_size:
+        self.items.popitem(last=False)
+    return value
+
+  def clear(self):
+    self.items.clear()
+
+def file_identity(path, hash_content=False):
+  # what a cached result depends on about a file: its size and modification time, or its contents
+  path = os.path.abspath(path)
+  if hash_content:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+      for chunk in iter(lambda: f.read(2**20), b""):
+        digest.update(chunk)
+    return (path, digest.hexdigest())
+  stat = os.stat(path)
+  return (path, stat.st_size, stat.st_mtime_ns)
+
+def _json_default(value):
+  if isinstance(value, SimpleNamespace):
+    return vars(value)
+  if isinstance(value, (np.generic, np.dtype)):
+    return str(value)
+  raise TypeError(f"can't use {type(value).__name__} in a cache key")
+
+class DiskCache:
+  # arrays stored on disk under a hash of what they were computed from, one .npz file per entry.
+  # reading an entry refreshes its modification time, and writing one evicts the least recently
+  # used entries until the directory is under max_bytes. entries are written to a temporary file
+  # and renamed into place, so several processes can share a directory
+  version = 1
+  suffix = ".npz"
+
+  def __init__(self, directory, max_bytes=2**30, hash_content=False):
+    self.directory = directory
+    self.max_bytes = max_bytes
+    self.hash_content = hash_content
+    os.makedirs(self.directory, exist_ok=True)
+
+  def file_identity(self, path):
+    return file_identity(path, self.hash_content)
+
+  def key(self, *parts):
+    # parts: json-serializable values (SimpleNamespaces and numpy scalars are fine too)
+    text = json.dumps([self.version, parts], sort_keys=True, default=_json_default)
+    return hashlib.sha256(text.encode()).hexdigest()
+
+  def _path(self, key):
+    return os.path.join(self.directory, key + self.suffix)
+
+  def load(self, key):
+    # {name: array}, or None if there's no entry
+    path = self._path(key)
+    try:
+      with np.load(path, allow_pickle=False) as entry:
+        arrays = {name: entry[name] for name in entry.files}
+      os.utime(path)
+    except (OSError, ValueError, EOFError, zipfile.BadZipFile):
+      # missing, evicted meanwhile or unreadable
+      return None
+    return arrays
+
+  def store(self, key, arrays):
+    fd, temp_path = tempfile.mkstemp(suffix=".tmp", dir=self.directory)
+    try:
+      with os.fdopen(fd, "wb") as f:
+        np.savez(f, **arrays)
+      os.replace(temp_path, self._path(key))
+    except BaseException:
+      os.unlink(temp_path)
+      raise
+    self.evict()
+
+  def evict(self):
+    entries = []
+    for entry in os.scandir(self.directory):
+      if entry.name.endswith(self.suffix):
+        try:
+          stat = entry.stat()
+        except FileNotFoundError:
+          continue
+        entries.append((stat.st_mtime_ns, stat.st_size, entry.path))
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+      if total <= self.max_bytes:
+        break
+      try:
+        os.unlink(path)
+      except FileNotFoundError:
+        pass
+      total -= size
+
+  def clear(self):
+    for entry in os.scandir(self.directory):
+      if entry.name.endswith(self.suffix):
+        os.unlink(entry.path)
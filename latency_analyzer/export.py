@@ -0,0 +1,76 @@
+import os
+import re
+import zipfile
+
+import numpy as np
+
+from .analysis import window_result_dtype
+
+# per-window results as columns, in .npz or Parquet. a dataset is a sequence of parts, and
+# appending adds a part without touching the existing ones:
+# - .npz: one archive with members "<part>/<column>.npy", written with zipfile's append mode
+# - .parquet: a directory of part-<part>.parquet files (needs pyarrow)
+
+def results_columns(results, bins):
+  # every column of a results_table(bins), plus the path and sample rate of each window's file
+  paths = {(bin_key, file_i): analysis.path or "" for bin_key, analyses in bins.items() for file_i, analysis in enumerate(analyses)}
+  sample_rates = {(bin_key, file_i): analysis.sample_rate for bin_key, analyses in bins.items() for file_i, analysis in enumerate(analyses)}
+  keys = list(zip(results["bin"].tolist(), results["file"].tolist()))
+
+  columns = {name: results[name] for name in ("bin", "file", "window") + window_result_dtype.names}
+  columns["path"] = np.array([paths[key] for key in keys], dtype=str)
+  columns["sample_rate"] = np.array([sample_rates[key] for key in keys], dtype=np.float64)
+  return columns
+
+def _parquet_part_paths(path):
+  if not os.path.isdir(path):
+    return []
+  names = sorted(fn for fn in os.listdir(path) if re.match(r"^part-\d+\.parquet$", fn))
+  return [os.path.join(path, fn) for fn in names]
+
+def _npz_parts(archive):
+  return sorted({name.split("/")[0] for name in archive.namelist() if "/" in name})
+
+def save_columns(path, columns, append=False):
+  if path.lower().endswith(".parquet"):
+    import pyarrow
+    import pyarrow.parquet
+
+    if not append:
+      for part_path in _parquet_part_paths(path):
+        os.unlink(part_path)
+    os.makedirs(path, exist_ok=True)
+    part = len(_parquet_part_paths(path))
+    table = pyarrow.table({name: np.asarray(values) for name, values in columns.items()})
+    pyarrow.parquet.write_table(table, os.path.join(path, f"part-{part:05d}.parquet"))
+    return
+
+  if not path.lower().endswith(".npz"):
+    raise ValueError(f"unknown results format: {path} (expected .npz or .parquet)")
+
+  mode = "a" if append and os.path.exists(path) else "w"
+  with zipfile.ZipFile(path, mode, compression=zipfile.ZIP_STORED, allowZip64=True) as archive:
+    part = len(_npz_parts(archive))
+    for name, values in columns.items():
+      with archive.open(f"{part:05d}/{name}.npy", "w", force_zip64=True) as f:
+        np.lib.format.write_array(f, np.asarray(values), allow_pickle=False)
+
+def load_columns(path):
+  # all parts of a dataset, concatenated
+  if path.lower().endswith(".parquet"):
+    import pyarrow.parquet
+
+    tables = [pyarrow.parquet.read_table(part_path) for part_path in _parquet_part_paths(path)]
+    if not tables:
+      return {}
+    return {name: np.concatenate([table.column(name).to_numpy() for table in tables]) for name in tables[0].column_names}
+
+  parts = {}
+  with np.load(path, allow_pickle=False) as archive:
+    for member in archive.files:
+      part, name = member.split("/")
+      parts.setdefault(part, {})[name] = archive[member]
+  if not parts:
+    return {}
+  names = parts[min(parts)].keys()
+  return {name: np.concatenate([parts[part][name] for part in sorted(parts)]) for name in names}
@@ -0,0 +1,112 @@
+import numpy as np
+
+# level-of-detail plotting of long, evenly sampled signals. a MinMaxPyramid has the min and max
+# of the signal over blocks of 2, 4, 8, ... samples, so any visible range can be drawn with about
+# two points per pixel column: the samples themselves when zoomed in far enough, otherwise the
+# min and max of each block at the coarsest level that still has a block per column.
+# x values are never stored; sample i is at x0 + i*dx
+
+class MinMaxPyramid:
+  # levels with blocks shorter than 2**base_level are computed from the samples when needed,
+  # which keeps the stored levels at 1/2**(base_level-1) of the signal's size
+  base_level = 4
+  # the smallest level kept, in blocks
+  min_level_len = 256
+
+  def __init__(self, y, x0=0.0, dx=1.0):
+    self.y = y
+    self.x0 = x0
+    self.dx = dx
+    # levels[k] holds (mins, maxs) over blocks of 2**(base_level+k) samples
+    self.levels = []
+    mins = maxs = y
+    level = 0
+    while len(mins) >= 2 * self.min_level_len:
+      if len(mins) % 2 != 0:
+        # a trailing odd block makes a block of its own
+        mins = np.append(mins, mins[-1])
+        maxs = np.append(maxs, maxs[-1])
+      mins = np.minimum(mins[0::2], mins[1::2])
+      maxs = np.maximum(maxs[0::2], maxs[1::2])
+      level += 1
+      if level >= self.base_level:
+        self.levels.append((mins, maxs))
+
+  @staticmethod
+  def _block_min_max(y, block_len):
+    # a trailing partial block is padded with its last sample
+    pad = -len(y) % block_len
+    blocks = (np.append(y, np.full(pad, y[-1])) if pad else y).reshape(-1, block_len)
+    return np.min(blocks, axis=-1), np.max(blocks, axis=-1)
+
+  def __len__(self):
+    return len(self.y)
+
+  def index_range(self, x_start, x_end):
+    # samples covering [x_start, x_end], one past each end so lines run to the edges
+    i0 = int(np.floor((x_start - self.x0) / self.dx)) - 1
+    i1 = int(np.ceil((x_end - self.x0) / self.dx)) + 2
+    return max(i0, 0), min(max(i1, 0), len(self.y))
+
+  def visible(self, x_start, x_end, num_columns, i_min=0, i_max=None):
+    # (x, y) to draw samples [i_min, i_max) in [x_start, x_end] over num_columns pixel columns
+    i0, i1 = self.index_range(x_start, x_end)
+    i0 = max(i0, i_min)
+    i1 = min(i1, i_max if i_max is not None else len(self.y))
+    if i1 <= i0:
+      return np.zeros(0), np.zeros(0)
+
+    num_columns = max(int(num_columns), 1)
+    max_level = self.base_level + len(self.levels) - 1 if self.levels else self.base_level - 1
+    level = 0
+    while level < max_level and (i1 - i0) >> (level + 1) >= num_columns:
+      level += 1
+    if level == 0:
+      return self.x0 + np.arange(i0, i1) * self.dx, self.y[i0:i1]
+
+    block_len = 1 << level
+    b0 = i0 >> level
+    b1 = -(-i1 // block_len)
+    if level < self.base_level:
+      mins, maxs = self._block_min_max(self.y[b0*block_len:b1*block_len], block_len)
+    else:
+      mins, maxs = self.levels[level - self.base_level]
+      mins, maxs = mins[b0:b1], maxs[b0:b1]
+    # each block as a vertical stroke from its min to its max at the block's first sample
+    x = np.repeat(self.x0 + np.arange(b0, b0 + len(mins)) * block_len * self.dx, 2)
+    y = np.empty(2 * len(mins), dtype=mins.dtype)
+    y[0::2] = mins
+    y[1::2] = maxs
+    return x, y
+
+class LODLine:
+  # keeps a Line2D showing a MinMaxPyramid at the resolution of its axes' current x limits and
+  # width, and redraws its data whenever the x limits change. i_min and i_max limit the samples
+  # shown (e.g. to a trimmed range)
+  def __init__(self, line, pyramid, i_min=0, i_max=None):
+    self.line = line
+    self.pyramid = pyramid
+    self.i_min = i_min
+    self.i_max = i_max
+    self.ax = line.axes
+    self.ax.callbacks.connect("xlim_changed", lambda ax: self.update())
+    self.ax.figure.canvas.mpl_connect("resize_event", lambda event: self.update())
+    self.update()
+
+  def set_range(self, i_min, i_max):
+    self.i_min = i_min
+    self.i_max = i_max
+    self.update()
+
+  def update(self):
+    x_start, x_end = self.ax.get_xlim()
+    num_columns = self.ax.bbox.width if self.ax.bbox.width > 1 else 1000
+    self.line.set_data(*self.pyramid.visible(x_start, x_end, num_columns, self.i_min, self.i_max))
+
+def plot_lod(ax, y, x0=0.0, dx=1.0, **kwargs):
+  # ax.plot for an evenly sampled signal, drawn through a MinMaxPyramid
+  line = ax.plot([], [], **kwargs)[0]
+  if len(y) > 0:
+    ax.update_datalim([(x0, np.min(y)), (x0 + (len(y) - 1) * dx, np.max(y))])
+    ax.autoscale_view()
+  return LODLine(line, MinMaxPyramid(y, x0, dx))
@@ -0,0 +1,122 @@
+import contextlib
+import csv
+import json
+import time
+import tracemalloc
+
+import numpy as np
+
+# wall time, and optionally bytes allocated, per stage of an analysis. each analysis records into
+# its own Profiler, which travels back from pool processes with the analysis. when profiling is off
+# the analyses use null_profiler, whose stages are one shared no-op context manager
+
+stages = ("load", "normalize", "envelope", "swing_freq", "correlate", "peak_pick")
+
+# start and stop are the sample range of the window (or batch of windows) a stage worked on, or -1
+# for stages that work on the whole file. alloc_bytes is the peak traced allocation during the
+# stage, or -1 without trace_memory
+profile_record_dtype = np.dtype([
+  ("file", object),
+  ("stage", object),
+  ("start", np.int64),
+  ("stop", np.int64),
+  ("seconds", np.float64),
+  ("alloc_bytes", np.int64),
+])
+
+class _Stage:
+  __slots__ = ("profiler", "name", "start", "stop", "t0", "mem0")
+
+  def __init__(self, profiler, name, start, stop):
+    self.profiler = profiler
+    self.name = name
+    self.start = start
+    self.stop = stop
+
+  def __enter__(self):
+    if self.profiler.trace_memory:
+      tracemalloc.reset_peak()
+      self.mem0 = tracemalloc.get_traced_memory()[0]
+    self.t0 = time.perf_counter()
+    return self
+
+  def __exit__(self, *exc_info):
+    seconds = time.perf_counter() - self.t0
+    alloc_bytes = tracemalloc.get_traced_memory()[1] - self.mem0 if self.profiler.trace_memory else -1
+    self.profiler.records.append((self.profiler.file, self.name, self.start, self.stop, seconds, alloc_bytes))
+    return False
+
+class Profiler:
+  enabled = True
+
+  def __init__(self, file=None, trace_memory=False):
+    self.file = file
+    self.trace_memory = trace_memory
+    self.records = []
+    if trace_memory and not tracemalloc.is_tracing():
+      tracemalloc.start()
+
+  def stage(self, name, start=-1, stop=-1):
+    return _Stage(self, name, start, stop)
+
+  def __getstate__(self):
+    # tracing is per process; a profiler unpickled elsewhere only carries its records
+    return {"file": self.file, "trace_memory": False, "records": self.records}
+
+class NullProfiler:
+  enabled = False
+  records = ()
+
+  _null_stage = contextlib.nullcontext()
+
+  def stage(self, name, start=-1, stop=-1):
+    return self._null_stage
+
+null_profiler = NullProfiler()
+
+def profile_records(profilers):
+  return np.array([record for profiler in profilers for record in profiler.records], dtype=profile_record_dtype)
+
+def profile_summary(records):
+  # {stage: totals over all records of the stage}, in pipeline order
+  summary = {}
+  for stage in stages:
+    stage_records = records[records["stage"] == stage]
+    if len(stage_records) == 0:
+      continue
+    seconds = stage_records["seconds"]
+    alloc_bytes = stage_records["alloc_bytes"]
+    summary[stage] = {
+      "count": len(stage_records),
+      "total_seconds": float(np.sum(seconds)),
+      "mean_seconds": float(np.mean(seconds)),
+      "max_seconds": float(np.max(seconds)),
+      "max_alloc_bytes": int(np.max(alloc_bytes)),
+    }
+  total_seconds = sum(stage_summary["total_seconds"] for stage_summary in summary.values())
+  for stage_summary in summary.values():
+    stage_summary["share"] = stage_summary["total_seconds"] / total_seconds if total_seconds > 0 else 0.0
+  return summary
+
+def save_profile(path, profilers):
+  # .json: the per-stage summary and every record; anything else: the records as CSV
+  records = profile_records(profilers)
+  if path.lower().endswith(".json"):
+    with open(path, "w") as f:
+      json.dump({
+        "summary": profile_summary(records),
+        "records": [dict(zip(profile_record_dtype.names, record)) for record in records.tolist()],
+      }, f, indent=2)
+    return
+
+  with open(path, "w", newline="") as csvfile:
+    writer = csv.writer(csvfile)
+    writer.writerow(profile_record_dtype.names)
+    writer.writerows(records.tolist())
+
+def format_profile_summary(summary):
+  lines = [f"{'stage':<12} {'count':>7} {'total s':>9} {'mean ms':>9} {'max ms':>9} {'max MB':>8} {'share':>6}"]
+  for stage, stage_summary in summary.items():
+    max_mb = f"{stage_summary['max_alloc_bytes'] / 2**20:.1f}" if stage_summary["max_alloc_bytes"] >= 0 else "-"
+    lines.append(f"{stage:<12} {stage_summary['count']:>7} {stage_summary['total_seconds']:>9.3f} {stage_summary['mean_seconds']*1000:>9.3f} {stage_summary['max_seconds']*1000:>9.3f} {max_mb:>8} {stage_summary['share']*100:>5.1f}%")
+  return "\n".join(lines)
@@ -0,0 +1,123 @@
+import os
+import struct
+from types import SimpleNamespace
+
+import numpy as np
+
+from .analysis import duration_to_samples
+
+WAVE_FORMAT_PCM = 0x0001
+WAVE_FORMAT_IEEE_FLOAT = 0x0003
+WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+
+# sample formats numpy can map directly; 24-bit PCM has no numpy dtype
+wav_sample_dtypes = {
+  (WAVE_FORMAT_PCM, 8): np.dtype("u1"),
+  (WAVE_FORMAT_PCM, 16): np.dtype("<i2"),
+  (WAVE_FORMAT_PCM, 32): np.dtype("<i4"),
+  (WAVE_FORMAT_IEEE_FLOAT, 32): np.dtype("<f4"),
+  (WAVE_FORMAT_IEEE_FLOAT, 64): np.dtype("<f8"),
+}
+
+def read_wav_info(path):
+  # layout of an uncompressed (RF64 or RIFF) WAV file, or None if its samples can't be mapped
+  with open(path, "rb") as f:
+    riff_id, _, wave_id = struct.unpack("<4sI4s", f.read(12))
+    if riff_id not in (b"RIFF", b"RF64") or wave_id != b"WAVE":
+      return None
+
+    fmt = None
+    ds64_data_size = None
+    while True:
+      header = f.read(8)
+      if len(header) < 8:
+        return None
+      chunk_id, chunk_size = struct.unpack("<4sI", header)
+      chunk_start = f.tell()
+
+      if chunk_id == b"ds64":
+        # RF64 keeps the 64-bit sizes here, and 0xFFFFFFFF in the chunk headers
+        _, ds64_data_size = struct.unpack("<QQ", f.read(16))
+      elif chunk_id == b"fmt ":
+        format_tag, num_channels, sample_rate, _, block_align, bits = struct.unpack("<HHIIHH", f.read(16))
+        if format_tag == WAVE_FORMAT_EXTENSIBLE and chunk_size >= 40:
+          # the format tag is the start of the subformat GUID
+          _, _, _, format_tag = struct.unpack("<HHIH", f.read(10))
+        fmt = SimpleNamespace(format_tag=format_tag, num_channels=num_channels, sample_rate=sample_rate, block_align=block_align, bits=bits)
+      elif chunk_id == b"data":
+        if fmt is None:
+          return None
+        data_size = ds64_data_size if chunk_size == 0xFFFFFFFF and ds64_data_size is not None else chunk_size
+        # a file that's still being written can have a stale size
+        data_size = min(data_size, os.path.getsize(path) - chunk_start)
+        break
+
+      f.seek(chunk_start + chunk_size + chunk_size % 2)
+
+  sample_dtype = wav_sample_dtypes.get((fmt.format_tag, fmt.bits))
+  if sample_dtype is None or fmt.block_align != fmt.num_channels * sample_dtype.itemsize:
+    return None
+
+  return SimpleNamespace(
+    sample_rate = fmt.sample_rate,
+    num_channels = fmt.num_channels,
+    num_frames = data_size // fmt.block_align,
+    sample_dtype = sample_dtype,
+    data_offset = chunk_start
+  )
+
+def read_sample_rate(path):
+  info = read_wav_info(path)
+  if info is not None:
+    return info.sample_rate
+
+  import soundfile
+
+  return soundfile.info(path).samplerate
+
+def _frame_range(start, length, sample_rate, num_frames):
+  start = min(max(duration_to_samples(start, sample_rate), 0), num_frames)
+  stop = num_frames if length is None else min(start + duration_to_samples(length, sample_rate), num_frames)
+  return int(start), int(max(stop, start))
+
+def _to_float(samples, sample_dtype, dtype):
+  # same scaling as soundfile (and so librosa.load)
+  if sample_dtype.kind == "f":
+    return samples.astype(dtype, copy=False)
+  out = samples.astype(dtype)
+  if sample_dtype.kind == "u":
+    out -= 2**(8*sample_dtype.itemsize - 1)
+  out *= 1 / 2**(8*sample_dtype.itemsize - 1)
+  return out
+
+def read_channels(path, channels, start=0, length=None, dtype=np.float32, block_len=2**16):
+  # the given channels of an audio file, from start for length (sample counts or durations, see
+  # duration_to_samples), as ([signal per channel], sample rate).
+  # uncompressed WAV data is memory-mapped, so only the requested range is read, and each signal
+  # is a strided view of the file where no conversion is needed. other files are read in blocks
+  # of block_len frames, keeping only the requested channels
+  dtype = np.dtype(dtype)
+  info = read_wav_info(path)
+  if info is not None:
+    for channel in channels:
+      if not 0 <= channel < info.num_channels:
+        raise ValueError(f"{path}: no channel {channel} in {info.num_channels} channels")
+    start, stop = _frame_range(start, length, info.sample_rate, info.num_frames)
+    frames = np.memmap(path, dtype=info.sample_dtype, mode="r", offset=info.data_offset, shape=(info.num_frames, info.num_channels))
+    signals = [_to_float(np.asarray(frames[start:stop, channel]), info.sample_dtype, dtype) for channel in channels]
+    return signals, info.sample_rate
+
+  import soundfile
+
+  with soundfile.SoundFile(path) as f:
+    for channel in channels:
+      if not 0 <= channel < f.channels:
+        raise ValueError(f"{path}: no channel {channel} in {f.channels} channels")
+    start, stop = _frame_range(start, length, f.samplerate, f.frames)
+    f.seek(start)
+    signals = np.empty((len(channels), stop - start), dtype=dtype)
+    pos = 0
+    for block in f.blocks(block_len, frames=stop - start, dtype=dtype.name, always_2d=True):
+      signals[:, pos:pos+len(block)] = block[:, channels].T
+      pos += len(block)
+    return list(signals[:, :pos]), f.samplerate
@@ -0,0 +1,68 @@
+from types import SimpleNamespace
+
+import numpy as np
+import scipy
+
+# synthetic recordings with a known latency, for checking and benchmarking the analyses.
+# the render signal (what the system under test plays back) is the mic signal delayed by a whole
+# number of samples, optionally through a reverb tail, plus white noise
+
+def reverb_impulse_response(sample_rate, reverb_time, level=0.3, rng=None):
+  # a direct path followed by exponentially decaying noise that is 60 dB down after reverb_time
+  rng = rng if rng is not None else np.random.default_rng()
+  length = max(1, int(reverb_time * sample_rate))
+  t = np.arange(length) / sample_rate
+  ir = level * rng.standard_normal(length) * np.exp(-6.9 * t / reverb_time) / np.sqrt(length) if reverb_time > 0 else np.zeros(length)
+  ir[0] = 1.0
+  return ir
+
+def _render_signal(mic, sample_rate, latency, noise, reverb_time, reverb_level, rng):
+  delay = int(round(latency * sample_rate))
+  num_samples = mic.shape[-1]
+  render = np.zeros(mic.shape)
+  render[..., delay:] = mic[..., :num_samples-delay]
+  if reverb_time > 0:
+    ir = reverb_impulse_response(sample_rate, reverb_time, reverb_level, rng)
+    render = scipy.signal.fftconvolve(render, ir[np.newaxis, :] if render.ndim > 1 else ir)[..., :num_samples]
+  render += noise * rng.standard_normal(render.shape)
+  return render, delay / sample_rate
+
+def swing_pair(sample_rate=48000, duration=60.0, latency=0.01, swing_freq=0.9, carrier_freq=440.0, depth=1.0, noise=0.01, reverb_time=0.0, reverb_level=0.3, seed=0, dtype=np.float32):
+  # a tone whose level swings at swing_freq (like a mic swinging past a speaker) as the mic
+  # signal, and the render signal latency seconds later
+  rng = np.random.default_rng(seed)
+  t = np.arange(int(duration * sample_rate)) / sample_rate
+  mic = np.sin(2*np.pi*carrier_freq*t) * (1 - depth/2 + depth/2 * np.sin(2*np.pi*swing_freq*t))
+  render, latency = _render_signal(mic, sample_rate, latency, noise, reverb_time, reverb_level, rng)
+  return SimpleNamespace(
+    mic = mic.astype(dtype),
+    render = render.astype(dtype),
+    sample_rate = sample_rate,
+    latency = latency,
+    swing_freq = swing_freq
+  )
+
+def click_train_pair(sample_rate=48000, duration=10.0, latency=0.01, click_interval=0.5, click_len=0.002, jitter=0.0, noise=0.005, reverb_time=0.0, reverb_level=0.3, seed=0, dtype=np.float32):
+  # decaying noise bursts every click_interval (+- jitter) seconds as the mic channel (0),
+  # and the render channel (1) latency seconds later, as one (2, num_samples) recording
+  rng = np.random.default_rng(seed)
+  num_samples = int(duration * sample_rate)
+  click_times = np.arange(click_interval / 2, duration - click_interval / 2, click_interval)
+  click_times = click_times + rng.uniform(-jitter, jitter, len(click_times))
+  click_samples = np.round(click_times * sample_rate).astype(np.int64)
+
+  click_n = max(1, int(click_len * sample_rate))
+  click = rng.standard_normal(click_n) * np.exp(-5 * np.arange(click_n) / click_n)
+  mic = np.zeros(num_samples)
+  for start in click_samples:
+    stop = min(start + click_n, num_samples)
+    mic[start:stop] += click[:stop-start]
+  mic /= np.max(np.abs(mic))
+
+  render, latency = _render_signal(mic, sample_rate, latency, noise, reverb_time, reverb_level, rng)
+  return SimpleNamespace(
+    audio = np.stack((mic, render)).astype(dtype),
+    sample_rate = sample_rate,
+    latency = latency,
+    click_times = click_samples / sample_rate
+  )
@@ -0,0 +1,28 @@
+import contextlib
+import io
+import os
+import sys
+from types import SimpleNamespace
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from latency_analyzer import synthetic
+from latency_analyzer.analysis import SwingAnalysis
+
+@pytest.fixture(scope="session")
+def recording():
+  # a 30 s swing pair with a known latency, shared by the analysis tests (which don't modify it)
+  return synthetic.swing_pair(duration=30.0, latency=0.0123, noise=0.01, reverb_time=0.3)
+
+@pytest.fixture
+def analyze(recording):
+  # analyze(**SwingAnalysis kwargs) of recording in 5 s windows, without the progress output
+  def _analyze(**kwargs):
+    with contextlib.redirect_stdout(io.StringIO()):
+      return SwingAnalysis(
+        recording.mic, recording.render, recording.sample_rate, 2000,
+        win_len=SimpleNamespace(seconds=5), env_trim=SimpleNamespace(seconds=0.1), **kwargs
+      )
+  return _analyze
@@ -0,0 +1,37 @@
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+repo_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# headless batch runs shouldn't pay for (or need a display for) the GUI stack
+import_script = """
+import json, sys, time
+start = time.perf_counter()
+import latency_analyzer.batch
+seconds = time.perf_counter() - start
+print(json.dumps({"seconds": seconds, "modules": sorted(sys.modules)}))
+"""
+
+gui_modules = ("tkinter", "_tkinter", "matplotlib.pyplot")
+
+# wall-clock limits depend on the machine, so the import time is only checked against a limit
+# given in seconds here (0.25 on a quiet desktop)
+max_import_s = os.environ.get("LATENCY_ANALYZER_MAX_IMPORT_S")
+
+def import_batch():
+  env = dict(os.environ, PYTHONPATH=repo_dir)
+  output = subprocess.run([sys.executable, "-c", import_script], cwd=repo_dir, env=env, capture_output=True, text=True, check=True).stdout
+  return json.loads(output)
+
+def test_batch_import_is_headless():
+  for module in import_batch()["modules"]:
+    assert module not in gui_modules and not module.startswith(("tkinter.", "matplotlib.backends.")), module
+
+@pytest.mark.skipif(max_import_s is None, reason="set LATENCY_ANALYZER_MAX_IMPORT_S to check the import time")
+def test_batch_import_is_fast():
+  # best of a few fresh interpreters, so one slow start doesn't fail it
+  assert min(import_batch()["seconds"] for _ in range(3)) < float(max_import_s)
@@ -0,0 +1,24 @@
+import numpy as np
+import pytest
+
+from latency_analyzer.analysis import xcorr_coarse_to_fine
+
+@pytest.mark.parametrize("batch", [False, True])
+def test_bounded_matches_full(recording, analyze, batch):
+  full = analyze(batch=batch).results
+  bounded = analyze(corr_mode="bounded", batch=batch).results
+  np.testing.assert_array_equal(bounded["lag"], full["lag"])
+  assert np.all(bounded["max_corr"] <= 1)
+  assert np.all(full["max_corr"] <= 1)
+
+def test_coarse_to_fine_without_coarse_peaks():
+  silent = np.zeros(48000)
+  with np.errstate(invalid="ignore"):
+    search = xcorr_coarse_to_fine(silent, silent, 0, 2000, 8)
+  assert 0 <= search.lag < 2000
+
+  # a band narrower than one decimation step has no coarse lags at all
+  x = np.random.default_rng(0).standard_normal(48000)
+  search = xcorr_coarse_to_fine(x, np.roll(x, -4), 3, 6, 8)
+  assert search.lag == 4
+  assert search.peak <= 1
@@ -0,0 +1,9 @@
+import numpy as np
+import pytest
+
+@pytest.mark.parametrize("batch", [False, True])
+def test_float32_lags_match_float64(recording, analyze, batch):
+  lags32 = analyze(dtype="float32", batch=batch).results["lag"]
+  lags64 = analyze(dtype="float64", batch=batch).results["lag"]
+  assert len(lags32) == len(lags64) > 0
+  assert np.all(np.abs(lags32 - lags64) * recording.sample_rate <= 1 + 1e-9)
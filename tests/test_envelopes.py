@@ -0,0 +1,34 @@
+import numpy as np
+import pytest
+import scipy.fft
+import scipy.signal
+
+from latency_analyzer import synthetic
+from latency_analyzer.analysis import envelope_hilbert
+
+@pytest.fixture(scope="module")
+def render():
+  recording = synthetic.swing_pair(duration=6.0, dtype=np.float64)
+  return recording.render, recording.sample_rate
+
+def scipy_envelope(x, n_fft=None):
+  mean = np.mean(x)
+  return np.abs(scipy.signal.hilbert(x - mean, N=n_fft)[:len(x)]) + mean
+
+# 230400 is a fast length, the others aren't
+@pytest.mark.parametrize("n", [230400, 230401, 240007])
+def test_hilbert_envelope_matches_padded_scipy(render, n):
+  x = render[0][:n]
+  np.testing.assert_allclose(envelope_hilbert(x), scipy_envelope(x, scipy.fft.next_fast_len(n, real=True)), rtol=0, atol=1e-12)
+
+@pytest.mark.parametrize("n", [230400, 230401, 240007])
+def test_hilbert_envelope_against_unpadded_scipy(render, n):
+  x, sample_rate = render
+  x = x[:n]
+  diffs = np.abs(envelope_hilbert(x) - scipy_envelope(x))
+  if scipy.fft.next_fast_len(n, real=True) == n:
+    assert np.max(diffs) < 1e-12
+  else:
+    # the padding only matters near the ends (up to ~0.4 there), which analyses trim off
+    trim = int(0.1 * sample_rate)
+    assert np.max(diffs[trim:-trim]) < 1e-3 * np.max(np.abs(x))
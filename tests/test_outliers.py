@@ -0,0 +1,66 @@
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from latency_analyzer.analysis import results_table, window_result_dtype
+from latency_analyzer.batch import outlier_order
+
+def fake_analysis(lags):
+  results = np.zeros(len(lags), dtype=window_result_dtype)
+  results["lag"] = lags
+  return SimpleNamespace(results=results)
+
+@pytest.fixture
+def bins():
+  return {
+    64: [fake_analysis([0.010, 0.011, 0.0135]), fake_analysis([0.0102, 0.0099])],
+    128: [fake_analysis([0.020, 0.017, 0.0201])],
+  }
+
+def arrival_table(bins, arrival):
+  # rows in the order analyses arrive during a run, as the GUI builds them
+  parts = []
+  for bin_key, file_i in arrival:
+    part = results_table({bin_key: [bins[bin_key][file_i]]})
+    part["file"] = file_i
+    parts.append(part)
+  return np.concatenate(parts)
+
+def window_keys(results, order):
+  return [(row["bin"].item(), row["file"].item(), row["window"].item()) for row in results[order]]
+
+arrival = [(128, 0), (64, 1), (64, 0)]
+
+def test_outlier_order_follows_the_table(bins):
+  unsorted = arrival_table(bins, arrival)
+  resorted = results_table(bins)
+  unsorted_order, unsorted_diffs = outlier_order(unsorted)
+  resorted_order, resorted_diffs = outlier_order(resorted)
+  # the same windows, furthest first (windows that tie may come in either order)
+  np.testing.assert_array_equal(unsorted_diffs, resorted_diffs)
+  assert dict(zip(window_keys(unsorted, unsorted_order), unsorted_diffs)) == dict(zip(window_keys(resorted, resorted_order), resorted_diffs))
+  # the row numbers themselves differ, so they can't be reused across tables
+  assert not np.array_equal(unsorted_order, resorted_order)
+
+def test_outliers_reset_when_the_table_is_replaced(bins):
+  pytest.importorskip("tkinter")
+  from latency_analyzer.app_swing import PlotWindow
+
+  # just the state _on_outlier uses, without any widgets
+  window = PlotWindow.__new__(PlotWindow)
+  window.outlier_var = SimpleNamespace(set=lambda text: None)
+  window.result_keys = {window._result_iid(("bin windows", bin_key)): ("bin windows", bin_key) for bin_key in bins}
+  selected = []
+  window._select_plot = selected.append
+
+  window.results = arrival_table(bins, arrival)
+  window._on_outlier(1)
+  # the run finishes, and save_outputs' table is sorted by bin
+  window.results = results_table(bins)
+  window._on_outlier(1)
+  window._on_outlier(1)
+
+  order, _ = outlier_order(results_table(bins))
+  expected = [("window",) + key for key in window_keys(results_table(bins), order[:2])]
+  assert selected == [expected[0]] + expected
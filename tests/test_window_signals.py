@@ -0,0 +1,45 @@
+import contextlib
+import io
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from latency_analyzer.analysis import SwingAnalysis
+
+@pytest.mark.parametrize("precompute_envs", [False, True])
+def test_window_signals_loads_only_the_window(recording, analyze, precompute_envs):
+  loaded = []
+  def signals_loader(start, stop):
+    loaded.append((start, stop))
+    return recording.mic[start:stop], recording.render[start:stop]
+
+  kept = analyze(include_signals=True, precompute_envs=precompute_envs)
+  with contextlib.redirect_stdout(io.StringIO()):
+    released = SwingAnalysis(
+      None, None, recording.sample_rate, 2000,
+      win_len=SimpleNamespace(seconds=5), env_trim=SimpleNamespace(seconds=0.1),
+      precompute_envs=precompute_envs, signals_loader=signals_loader
+    )
+  assert loaded == [(None, None)]
+  assert released.mic_sig is None
+
+  for result_i in (0, 3, len(released.results) - 1):
+    with contextlib.redirect_stdout(io.StringIO()):
+      window = released.window_signals(result_i)
+    expected = kept.window_signals(result_i)
+    start, stop = loaded[-1]
+    assert start <= window.start and window.stop <= stop
+    assert stop - start <= released.win_len + 2 * (released.rms_win_len + released.env_trim)
+    assert (window.start, window.stop) == (expected.start, expected.stop)
+    # normalized by the whole file's peaks, as in the analysis
+    np.testing.assert_allclose(window.mic_sig, expected.mic_sig, rtol=1e-6)
+    np.testing.assert_allclose(window.mic_env, expected.mic_env, rtol=1e-5, atol=1e-6)
+    if precompute_envs:
+      # the whole-file Hilbert envelope depends a little on samples outside the margin
+      np.testing.assert_allclose(window.render_env, expected.render_env, atol=3e-3)
+      assert abs(window.lag - expected.lag) * recording.sample_rate <= 1 + 1e-9
+    else:
+      np.testing.assert_allclose(window.render_env, expected.render_env, rtol=1e-6)
+      assert window.lag == expected.lag
+  assert released.mic_sig is None